@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 import time
+STARTUP_T0 = time.perf_counter() # Origin of the startup phase timings, taken before the heavy imports
 from src.modification_history import HistoryContainer, History
 from src.database import Database
 from src.observer import Observer, Announcer
-from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QTableWidgetItem, QTableWidget, QHeaderView, QFileDialog
+from src.table_model import QueryTableModel
+from src.drilldown_model import DrillDownModel
+from src.csv_export import CSVExportThread
+from src.query_executor import QueryExecutor
+from src.startup_timing import StartupTimer
+from src.formatting import CATEGORY_NAMES
+from src.backup import BackupScheduler, backupDatabase, snapshotPath
+from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QTableView, QTreeView, QHeaderView, QFileDialog
 from ui.main_window_ui import Ui_MainWindow
 from ui.mdi_tableWidget_ui import Ui_MDITableWidget
 from ui.student_infoDialog_ui import Ui_StudentInfoInputDialog
@@ -11,14 +19,25 @@ from ui.ui_event_infoDialog import Ui_EventInfoInputDialog
 from ui.table_editDialog_ui import Ui_TableEditDialog
 from PySide6.QtWidgets import QMessageBox
 import sys
+import os
 import csv
-from PySide6.QtWidgets import QDialog, QVBoxLayout, QComboBox, QPushButton, QLabel
-from PySide6.QtCore import Qt
+import sqlite3
+from datetime import date
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QComboBox, QPushButton, QLabel, QProgressDialog, QProgressBar, QLineEdit, QDialogButtonBox, QInputDialog
+from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtGui import QKeySequence
 
 db:Database = None
+queryExecutor:QueryExecutor = None
+startupTimer = StartupTimer(STARTUP_T0)
 header = None
-dbAnnouncer = Announcer()
-categoryMap = {'C':'綜援', 'F':'全免', 'H':'半免', 'D':'經濟困難', 'S':'特殊', 'all':'所有'}
+dbAnnouncer = Announcer(debounce_ms=50) # Coalesce bursts of database events into one refresh per view
+categoryMap = CATEGORY_NAMES
+# Automatic snapshots, LKM_BACKUP_INTERVAL_MIN=0 turns them off
+BACKUP_DIR = os.environ.get('LKM_BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_MIN = float(os.environ.get('LKM_BACKUP_INTERVAL_MIN', 60))
+BACKUP_KEEP = int(os.environ.get('LKM_BACKUP_KEEP', 10))
+FUZZY_ACCEPT_SCORE = 0.5 # Lowest score of a fuzzy roster match that is offered for accepting in bulk
 
 class SimpleDialog(QMessageBox):
     def __init__(self, title, text, type=QMessageBox.Information):
@@ -44,18 +63,15 @@ class StudentInfoInputDialog(QWidget, Ui_StudentInfoInputDialog):
         self.close()
 
     def addStudentData(self):
-        # Save the data to the database
-        for line in self.plainTextEdit.toPlainText().splitlines():
-            if line.strip():
-                # Split the line by comma and strip whitespace
-                data = [item.strip() for item in line.split(',')]
-                if len(data) == 4:
-                    class_name, class_number, name, category = data
-                    db.addStudent(class_name, class_number, name, category)
-                    dbAnnouncer.notify('student_added')
-                else:
-                    SimpleDialog("Input Error", "Invalid input format. Please check your input.")
-                    return False
+        # Split every non-empty line by comma, the whole paste is validated and inserted in one transaction
+        students = [line.split(',') for line in self.plainTextEdit.toPlainText().splitlines() if line.strip()]
+        try:
+            with db.useProfile('bulk-import'):
+                db.addStudents(students)
+        except ValueError as e:
+            SimpleDialog("Input Error", f"Invalid input format. Please check your input.\n{e}")
+            return False
+        dbAnnouncer.notify('student_added')
         # Show success message
         SimpleDialog("Input Successful", "Data has been successfully imported.")
         return True
@@ -101,81 +117,269 @@ class EventInfoInputDialog(QWidget, Ui_EventInfoInputDialog):
             dbAnnouncer.notify('event_added')
             SimpleDialog("Input Successful", "Event has been successfully added.")
 
-        # Now, let's add the students to the event, line by line.
-        # The whole process will look like a stack being pop from the start of the list.
-        # After processing the first line of input, we will remove it from the list.
-        # The process will continue until the list is empty.
+        # Now, let's add the students to the event in one go.
+        # Every line is checked first and all unmatched students are reported together, nothing is added until the whole roster resolves.
         # The input format is: class_name, class_number, name
 
-        lines = self.plainTextEdit.toPlainText().splitlines()
+        lines = [line for line in self.plainTextEdit.toPlainText().splitlines() if line.strip()]
         if not lines:
             SimpleDialog("Input Error", "No student data provided.")
             return False
-        
+
+        roster = []
         for line in lines:
-            if line.strip():
-                # Split the line by comma and strip whitespace
-                data = [item.strip() for item in line.split(',')]
-                if len(data) == 3:
-                    class_name, class_number, name = data
-                    sid = db.findSid(class_name, class_number, name)
-                    if sid:
-                        db.addRecord(sid, eid)
-                        dbAnnouncer.notify('record_added')
-                        lines = lines[1:]  # Remove the first line from the list
-                    else:
-                        SimpleDialog("Input Error", f"Student {name} not found in the database.")
-                        return False
-                else:                                                                                                     
-                    SimpleDialog("Input Error", "Invalid input format. Please check your input.")
-                    return False
-
-            # Update the text edit to show the remaining lines
-            self.plainTextEdit.setPlainText('\n'.join(lines))
+            # Split the line by comma, full-width ones included, and strip whitespace
+            data = [item.strip() for item in line.replace('，', ',').split(',')]
+            if len(data) != 3:
+                SimpleDialog("Input Error", f"Invalid input format. Please check your input.\n{line}")
+                return False
+            roster.append(data)
+
+        with db.useProfile('bulk-import'):
+            unmatched = db.enrollStudents(eid, roster)
+            if unmatched:
+                unmatched = self.resolveUnmatched(eid, roster, unmatched)
+        if unmatched:
+            # Keep only the unmatched lines in the editor so they can be fixed and submitted again
+            self.plainTextEdit.setPlainText('\n'.join(lines[index] for index, *_ in unmatched))
+            suggestions = db.suggestRosterMatches(unmatched, limit=1)
+            names = '\n'.join(
+                f"{class_name}, {class_number}, {name}" + (" (did you mean {0}, {1}, {2}?)".format(*suggestions[index][0][2:]) if suggestions[index] else "")
+                for index, class_name, class_number, name in unmatched
+            )
+            SimpleDialog("Input Error", f"{len(unmatched)} student(s) not found in the database, no students were added:\n{names}")
+            return False
+        dbAnnouncer.notify('record_added')
 
         SimpleDialog("Input Successful", f"Students have been successfully added to the event '{event_name}'.")
         return True
 
+    def resolveUnmatched(self, eid, roster, unmatched):
+        """
+        Offer the fuzzy matches of the unmatched roster lines, if every one of them has a confident one.
+        If the user accepts, the corrected roster is enrolled; return the lines that are still unmatched.
+        """
+        suggestions = db.suggestRosterMatches(unmatched)
+        best = {}
+        for index, candidates in suggestions.items():
+            # Confident: a good score and clearly ahead of the runner-up
+            if candidates and candidates[0][0] >= FUZZY_ACCEPT_SCORE and (len(candidates) == 1 or candidates[0][0] - candidates[1][0] >= 0.1):
+                best[index] = candidates[0]
+        if len(best) != len(unmatched):
+            return unmatched
+
+        changes = '\n'.join(
+            f"{class_name}, {class_number}, {name} → {best[index][2]}, {best[index][3]}, {best[index][4]}"
+            for index, class_name, class_number, name in unmatched
+        )
+        reply = QMessageBox.question(self, "Students Not Found",
+                                     f"{len(unmatched)} student(s) were not found exactly. Use these matches?\n{changes}",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.No:
+            return unmatched
+        corrected = [best[index][2:] if index in best else row for index, row in enumerate(roster)]
+        return db.enrollStudents(eid, corrected)
+
 class MDITableWidget(QWidget, Ui_MDITableWidget):
+    dataLoaded = Signal() # Emitted when the rows of setTableQuery or runTableQuery are in the table
+
     def __init__(self):
         super().__init__()
         self.setupUi(self)
         self.setMinimumSize(320, 240)
+        self.query = None # The (sql, params) query behind the table, if it was filled by setTableQuery or runTableQuery
+        self.pendingTask = None
+        self.queryGeneration = 0
+
+        # Busy state shown while a background query runs
+        self.busyBar = QProgressBar(self.controlPanel)
+        self.busyBar.setRange(0, 0)
+        self.busyBar.setTextVisible(False)
+        self.busyBar.hide()
+        self.gridLayout.addWidget(self.busyBar, 0, 3, 1, 1)
+        self.cancelButton = QPushButton("Cancel", self.controlPanel)
+        self.cancelButton.hide()
+        self.gridLayout.addWidget(self.cancelButton, 0, 4, 1, 1)
 
         self.pushButton.clicked.connect(self.saveToCSV)
-
-    def setTableData(self, horizontal_header, data):
-        self.tableWidget.setColumnCount(len(horizontal_header))
-        self.tableWidget.setRowCount(len(data))
-        self.tableWidget.setHorizontalHeaderLabels(horizontal_header)
-
-        for i, row in enumerate(data):
-            for j, item in enumerate(row):
-                self.tableWidget.setItem(i, j, QTableWidgetItem(str(item)))
-                
+        self.cancelButton.clicked.connect(self.cancelQuery)
+
+    def setTableData(self, horizontal_header, data, formatters=None):
+        """
+        Show query results in the table. data may be a list of rows or a live cursor, rows are paged in as the view scrolls.
+        """
+        oldModel = self.tableWidget.model()
+        self.tableWidget.setModel(QueryTableModel(horizontal_header, data, formatters, self.tableWidget))
+        if oldModel is not None:
+            oldModel.deleteLater()
+
+        # Section -1 keeps the query order until a header is clicked, instead of sorting (and loading) every row up front
+        self.tableWidget.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.tableWidget.setSortingEnabled(True)
         self.tableWidget.setAlternatingRowColors(True)
-        self.tableWidget.setSelectionBehavior(QTableWidget.SelectRows)
-        self.tableWidget.setSelectionMode(QTableWidget.SingleSelection)
-        self.tableWidget.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.tableWidget.setSelectionBehavior(QTableView.SelectRows)
+        self.tableWidget.setSelectionMode(QTableView.SingleSelection)
+        self.tableWidget.setEditTriggers(QTableView.NoEditTriggers)
         self.tableWidget.setShowGrid(True)
         self.tableWidget.resizeColumnsToContents()
         self.tableWidget.resizeRowsToContents()
         self.tableWidget.horizontalHeader().setStretchLastSection(True)
         self.tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
+    def setTableQuery(self, horizontal_header, query, formatters=None):
+        """
+        Run a (sql, params) query and show its rows, read in full right away like runTableQuery does in the background
+        A half-read cursor left to the view would hold its read open for as long as the window, and so keep the WAL from being checkpointed
+        """
+        self.query = query
+        self.setTableData(horizontal_header, db.fetchAllCached(query), formatters)
+        self.dataLoaded.emit()
+
+    def runTableQuery(self, horizontal_header, query, formatters=None):
+        """
+        Run a (sql, params) query on the background query executor and show its rows once it finishes
+        The window stays usable meanwhile and the query can be cancelled from its control panel
+        """
+        self.cancelQuery()
+        self.query = query
+        # Nothing written since this report was last read, show the cached rows straight away
+        writeGeneration = db.getWriteGeneration()
+        rows = db.resultCache.get(query, writeGeneration)
+        if rows is not None:
+            self.setTableData(horizontal_header, rows, formatters)
+            self.dataLoaded.emit()
+            return
+
+        self.setTableData(horizontal_header, [], formatters)
+        self.queryGeneration += 1
+        generation = self.queryGeneration
+        self.pendingTask = queryExecutor.submit(
+            query,
+            finished=lambda rows: self.onQueryFinished(generation, horizontal_header, query, rows, formatters, writeGeneration),
+            failed=lambda message: self.onQueryFailed(generation, message)
+        )
+        self.setBusy(True)
+
+    def cancelQuery(self):
+        if self.pendingTask is not None:
+            task, self.pendingTask = self.pendingTask, None
+            # Results of a replaced query that are already on their way are dropped by the generation check
+            self.queryGeneration += 1
+            queryExecutor.cancel(task)
+            self.setBusy(False)
+
+    def onQueryFinished(self, generation, horizontal_header, query, rows, formatters, writeGeneration):
+        # Cached under the generation read before the query ran, so rows racing a write are never served later
+        db.resultCache.put(query, writeGeneration, rows)
+        if generation != self.queryGeneration:
+            return
+        self.pendingTask = None
+        self.setBusy(False)
+        self.setTableData(horizontal_header, rows, formatters)
+        self.dataLoaded.emit()
+
+    def onQueryFailed(self, generation, message):
+        if generation != self.queryGeneration:
+            return
+        self.pendingTask = None
+        self.setBusy(False)
+        SimpleDialog("Query Failed", message, QMessageBox.Warning)
+
+    def setBusy(self, busy):
+        self.busyBar.setVisible(busy)
+        self.cancelButton.setVisible(busy)
+        self.pushButton.setEnabled(not busy)
+        self.tableWidget.setCursor(Qt.BusyCursor if busy else Qt.ArrowCursor)
+
+    def closeEvent(self, event):
+        self.cancelQuery()
+        super().closeEvent(event)
+
     def saveToCSV(self):
         file_name, _ = QFileDialog.getSaveFileName(self, "Save CSV File", "", "CSV Files (*.csv)")
-        if file_name:
+        if not file_name or self.tableWidget.model() is None:
+            return
+        model = self.tableWidget.model()
+        if self.query is None:
+            # Tables filled from plain rows have no query to re-run, export what the model holds
             with open(file_name, 'w', newline='', encoding='utf-8') as csvfile:
-                # Write header
                 writer = csv.writer(csvfile)
-                writer.writerow([self.tableWidget.horizontalHeaderItem(i).text() for i in range(self.tableWidget.columnCount())])
-                # Write data
-                writer.writerows([
-                    [self.tableWidget.item(i, j).text() if self.tableWidget.item(i, j) else '' for j in range(self.tableWidget.columnCount())]
-                    for i in range(self.tableWidget.rowCount())
-                ])
+                writer.writerow(model.headers())
+                writer.writerows(model.iterDisplayRows())
+            return
+        # A model that has paged in every row knows how many the export will write
+        total = None if model.canFetchMore() else model.rowCount()
+        self.exportToCSV(file_name, self.query, model.headers(), model.formatters(), total)
+
+    def exportToCSV(self, file_name, query, headers, formatters=None, total=None):
+        """
+        Re-run a (sql, params) query on a worker thread and stream it into a CSV file, keeping the GUI responsive
+        Progress is shown against total if it is given, otherwise as a busy bar with the number of rows written so far
+        """
+        progressDialog = QProgressDialog("Exporting to CSV...", "Cancel", 0, 0, self)
+        progressDialog.setWindowTitle("Save CSV File")
+        progressDialog.setWindowModality(Qt.WindowModal)
+        progressDialog.setMinimumDuration(500)
+        self.exportThread = CSVExportThread(db.openReadConnection, query, headers, file_name, formatters, total, self)
+        self.exportThread.progress.connect(lambda written, total: (
+            progressDialog.setLabelText(f"Exporting to CSV... {written} rows written"),
+            progressDialog.setMaximum(total),
+            progressDialog.setValue(written)
+        ))
+        self.exportThread.failed.connect(lambda message: SimpleDialog("Export Failed", message, QMessageBox.Warning))
+        self.exportThread.finished.connect(progressDialog.reset)
+        progressDialog.canceled.connect(self.exportThread.cancel)
+        self.exportThread.start()
+
+class DrillDownMDIWidget(MDITableWidget):
+    """
+    A report of groups, e.g. events with their number of participants, shown as a tree whose groups page in their members when expanded.
+    The top level is loaded in the background like any other report, so opening it costs the same however many members the groups have.
+    Saving to CSV writes the flat report given to setDrillDown instead, one line per group.
+    """
+    def __init__(self):
+        super().__init__()
+        self.treeView = QTreeView(self)
+        self.treeView.setUniformRowHeights(True)
+        self.treeView.setAlternatingRowColors(True)
+        self.treeView.setEditTriggers(QTreeView.NoEditTriggers)
+        self.verticalLayout.replaceWidget(self.tableWidget, self.treeView)
+        self.tableWidget.hide()
+        self.fetchPage = None
+        self.countColumn = 0
+        self.memberColumn = 0
+        self.exportHeader = None
+        self.exportQuery = None
+
+    def setDrillDown(self, horizontal_header, query, fetchPage, count_column, member_column, export_header, export_query):
+        """
+        Show the groups of a (sql, params) query, whose rows are led by the key passed to fetchPage(key, after, limit) to get members
+        """
+        self.fetchPage = fetchPage
+        self.countColumn = count_column
+        self.memberColumn = member_column
+        self.exportHeader = export_header
+        self.exportQuery = export_query
+        self.runTableQuery(horizontal_header, query)
+
+    def setTableData(self, horizontal_header, data, formatters=None):
+        oldModel = self.treeView.model()
+        self.treeView.setModel(DrillDownModel(horizontal_header, data, self.fetchPage, self.countColumn, self.memberColumn, self.treeView))
+        if oldModel is not None:
+            oldModel.deleteLater()
+        self.treeView.header().setStretchLastSection(True)
+        for column in range(self.memberColumn):
+            self.treeView.resizeColumnToContents(column)
+
+    def setBusy(self, busy):
+        super().setBusy(busy)
+        self.treeView.setCursor(Qt.BusyCursor if busy else Qt.ArrowCursor)
+
+    def saveToCSV(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save CSV File", "", "CSV Files (*.csv)")
+        if not file_name or self.exportQuery is None:
+            return
+        self.exportToCSV(file_name, self.exportQuery, self.exportHeader)
 
 class FixedMDITableWidget(MDITableWidget):
     """
@@ -188,7 +392,44 @@ class FixedMDITableWidget(MDITableWidget):
     def closeEvent(self, event):
         event.ignore()  # Ignore the close event to prevent closing the window
 
+class StudentSearchMDITableWidget(FixedMDITableWidget):
+    """
+    The fixed students table with a search box in its control panel.
+    Typing is debounced, the search runs once the text has been still for SEARCH_DELAY_MS.
+    """
+    SEARCH_DELAY_MS = 200
+    HEADER = ['班別', '學號', '姓名', '經濟情況']
+
+    def __init__(self):
+        super().__init__()
+        self.searchLineEdit = QLineEdit(self.controlPanel)
+        self.searchLineEdit.setPlaceholderText("搜尋姓名或班別")
+        self.searchLineEdit.setClearButtonEnabled(True)
+        self.gridLayout.removeItem(self.horizontalSpacer)
+        self.gridLayout.addWidget(self.searchLineEdit, 0, 2, 1, 1)
+
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(self.SEARCH_DELAY_MS)
+        self.searchTimer.timeout.connect(self.search)
+        self.searchLineEdit.textChanged.connect(self.searchTimer.start)
+        self.searchLineEdit.returnPressed.connect(self.search)
+
+    def searchQuery(self):
+        """
+        Get the query of the students matching the search box, all students if it is empty
+        """
+        return db.searchStudentsQuery(self.searchLineEdit.text())
+
+    def search(self):
+        self.searchTimer.stop()
+        self.runTableQuery(self.HEADER, self.searchQuery())
+
 class DataEditDialog(QDialog, Ui_TableEditDialog):
+    """
+    Edit students and events. Deleted rows are collected in a HistoryContainer, with Ctrl+Z/Ctrl+Y to undo and redo,
+    Apply writes the whole change set in one transaction, Reset undoes everything and Discard closes without saving.
+    """
     def __init__(self):
         super().__init__()
         self.setupUi(self)
@@ -196,57 +437,80 @@ class DataEditDialog(QDialog, Ui_TableEditDialog):
         self.setWindowIcon(self.windowIcon())
         self.setFixedSize(640, 480)
 
-        self.setTableData(self.studentInfoTable, ['班別', '學號', '姓名', '經濟情況'], db.getAllStudents())
-        self.setTableData(self.eventInfoTable, ['活動名稱'], db.getAllEvents())
+        # The first column of both tables is the primary key, it is hidden and used to identify the rows to change
+        self.setTableData(self.studentInfoTable, ['sid', '班別', '學號', '姓名', '經濟情況'], db.getAllStudentsWithIds())
+        self.setTableData(self.eventInfoTable, ['eid', '活動名稱'], db.getAllEventsWithIds())
+        self.tables = {'students': self.studentInfoTable, 'events': self.eventInfoTable}
 
         self.keyPressEvent = self.keyPressEventHandler
+        self.buttonBox.clicked.connect(self.onButtonClicked)
 
         self.historyContainer = HistoryContainer()
-        
+        self.updateButtons()
+
     def keyPressEventHandler(self, event):
-        if event.key() == Qt.Key_Delete:
+        if event.matches(QKeySequence.Undo):
+            self.undo()
+        elif event.matches(QKeySequence.Redo):
+            self.redo()
+        elif event.key() == Qt.Key_Delete:
 
             # Check which table is currently active
-            if self.studentInfoTable.isCurrentWidget():
-                table = self.studentInfoTable
-            elif self.eventInfoTable.isCurrentWidget():
-                table = self.eventInfoTable
+            if self.tabWidget.currentWidget() is self.tab:
+                table_name = 'students'
+            elif self.tabWidget.currentWidget() is self.tab_2:
+                table_name = 'events'
             else:
                 return
 
-            selected_rows = table.selectionModel().selectedRows()
-            for row in reversed(selected_rows): # Reverse to avoid index shifting
-                row_index = row.row()
-                # Data are stored in the history container, so we can delete them later
-                if table == self.studentInfoTable:
-                    self.historyContainer.addHistory(History(
-                        action='delete',
-                        table='students',
-                        class_name=table.item(row_index, 0).text(),
-                        class_number=table.item(row_index, 1).text(),
-                        std_name=table.item(row_index, 2).text(),
-                        category=table.item(row_index, 3).text()
-                    ))
-                elif table == self.eventInfoTable:
-                    self.historyContainer.addHistory(History(
-                        action='delete',
-                        table='events',
-                        event_name=table.item(row_index, 0).text()
-                    ))
-                # Remove the item from the table
-                table.removeRow(row_index)  # This method removes the row from the table, causing index shifting
+            table = self.tables[table_name]
+            model = table.model()
+            selected_rows = sorted(index.row() for index in table.selectionModel().selectedRows())
+            for row_index in reversed(selected_rows): # Reverse to avoid index shifting
+                row = model.rowData(row_index)
+                # The deletion is kept in the history container by primary key, it is written when the dialog is applied
+                self.historyContainer.addHistory(History('delete', table_name, row[0], row, row_index))
+                # Remove the row from the table
+                model.removeRows(row_index, 1)  # This method removes the row from the table, causing index shifting
+            self.updateButtons()
         else:
             super().keyPressEvent(event)
 
-    def setTableData(self, table: QTableWidget, horizontal_header, data):
-        table.setColumnCount(len(horizontal_header))
-        table.setRowCount(len(data))
-        table.setHorizontalHeaderLabels(horizontal_header)
-
-        for i, row in enumerate(data):
-            for j, item in enumerate(row):
-                table.setItem(i, j, QTableWidgetItem(str(item)))
-
+    def undo(self):
+        entry = self.historyContainer.undo()
+        if entry is not None:
+            self.tables[entry.table].model().insertRowData(entry.position, entry.row)
+        self.updateButtons()
+
+    def redo(self):
+        entry = self.historyContainer.redo()
+        if entry is not None:
+            # The table may have been sorted since, find the row by its key
+            model = self.tables[entry.table].model()
+            row = model.findRow(0, entry.key)
+            if row >= 0:
+                model.removeRows(row, 1)
+        self.updateButtons()
+
+    def updateButtons(self):
+        hasChanges = self.historyContainer.canUndo()
+        self.buttonBox.button(QDialogButtonBox.Apply).setEnabled(hasChanges)
+        self.buttonBox.button(QDialogButtonBox.Reset).setEnabled(hasChanges)
+
+    def onButtonClicked(self, button):
+        standard_button = self.buttonBox.standardButton(button)
+        if standard_button == QDialogButtonBox.Apply:
+            self.accept()
+        elif standard_button == QDialogButtonBox.Reset:
+            while self.historyContainer.canUndo():
+                self.undo()
+        elif standard_button == QDialogButtonBox.Discard:
+            self.reject()
+
+    def setTableData(self, table: QTableView, horizontal_header, data):
+        table.setModel(QueryTableModel(horizontal_header, data, parent=table))
+        table.setColumnHidden(0, True)
+        table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         table.setSortingEnabled(True)
         table.setAlternatingRowColors(True)
         table.setShowGrid(True)
@@ -256,8 +520,20 @@ class DataEditDialog(QDialog, Ui_TableEditDialog):
         table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
     def accept(self):
-        # Save the data to the database
-        pass
+        # Save the change set to the database in one transaction
+        changes = self.historyContainer.changes()
+        if changes:
+            try:
+                db.applyChanges(changes)
+            except sqlite3.Error as e:
+                SimpleDialog("Save Failed", f"No changes were saved:\n{e}", QMessageBox.Warning)
+                return
+            self.historyContainer.clearHistory()
+            with dbAnnouncer.batch():
+                dbAnnouncer.notify('student_added')
+                dbAnnouncer.notify('event_added')
+                dbAnnouncer.notify('record_added')
+        self.close()
 
     def reject(self):
         self.close()
@@ -268,51 +544,119 @@ class MainWindowMeta(type(QMainWindow), type(Observer)):
 
 class MainWindow(QMainWindow, Ui_MainWindow, Observer, metaclass=MainWindowMeta):
 
-    def __init__(self):
+    def __init__(self, deferred=True):
+        """
+        With deferred set, the window is shown right away and the default subwindows are filled on the background
+        query executor once it has been painted. Otherwise they are filled before the constructor returns.
+        """
         super().__init__()
         self.setupUi(self)
-        self.show()
-        self.studentInfoWidget = StudentInfoInputDialog()
-        self.eventInfoWidget = EventInfoInputDialog()
+        self.deferred = deferred
+        # The input dialogs are built on first use
+        self.studentInfoWidget = None
+        self.eventInfoWidget = None
 
         self.actionAbout.triggered.connect(self.showAbout)
 
         ### Control Panel ###
-        self.manualStudentInfoButton.clicked.connect(lambda: self.studentInfoWidget.show())
-        self.manualEventInfoButton.clicked.connect(lambda: self.eventInfoWidget.show())
+        self.manualStudentInfoButton.clicked.connect(self.showStudentInfoInput)
+        self.manualEventInfoButton.clicked.connect(self.showEventInfoInput)
         self.manualEditInfoButton.clicked.connect(self.dataEditor)
 
         self.studentParticipatesButton.clicked.connect(self.studentParticipates)
         self.studentParticipatesByEventButton.clicked.connect(self.studentParticipatesByEvents)
         self.studentEventTableWithCategoryButton.clicked.connect(self.studentEventTableWithCategory)
         self.studentEventTableWithCategoryAndNameButton.clicked.connect(self.studentEventTableWithCategoryAndName)
+        self.categoryCrosstabButton.clicked.connect(self.categoryCrosstab)
+        self.studentYearlyCountsButton.clicked.connect(self.studentYearlyCounts)
+        self.actionArchiveYear.triggered.connect(self.archiveSchoolYear)
+        self.actionBackupNow.triggered.connect(self.backupNow)
+        self.actionRestoreBackup.triggered.connect(self.restoreBackup)
+
+        ### Snapshots of the database, taken on a worker thread while the window stays usable ###
+        self.backupScheduler = BackupScheduler(db.openReadConnection, db.db_name, BACKUP_DIR, BACKUP_INTERVAL_MIN or 60, BACKUP_KEEP, self)
+        self.backupScheduler.snapshotTaken.connect(lambda path: self.statusbar.showMessage(f"Backup saved to {path}", 5000))
+        self.backupScheduler.snapshotFailed.connect(lambda message: SimpleDialog("Backup Failed", message, QMessageBox.Warning))
+        if BACKUP_INTERVAL_MIN > 0:
+            self.backupScheduler.start()
 
         ### Register to the database announcer ###
-        dbAnnouncer.register(self)
+        dbAnnouncer.register(self, ('student_added', 'event_added', 'record_added'))
 
-        ### Load the database and initialize the table widget ###
-        global db
-        self.studentsSubWindow = FixedMDITableWidget()
+        ### Create the default subwindows, their data is loaded by loadDefaultSubWindows ###
+        self.studentsSubWindow = StudentSearchMDITableWidget()
         self.mdiArea.addSubWindow(self.studentsSubWindow)
-        # Map the fourth column to text using categoryMap
-        students_data = db.getAllStudents()
-        mapped_students_data = [
-            [*row[:3], categoryMap.get(row[3], row[3])] for row in students_data
-        ]
-        self.studentsSubWindow.setTableData(['班別', '學號', '姓名', '經濟情況'], mapped_students_data)
         self.studentsSubWindow.show()
 
         self.eventsSubWindow = FixedMDITableWidget()
         self.mdiArea.addSubWindow(self.eventsSubWindow)
-        self.eventsSubWindow.setTableData(['活動名稱'], db.getAllEvents())
         self.eventsSubWindow.show()
 
         self.recordsSubWindow = MDITableWidget()
         self.mdiArea.addSubWindow(self.recordsSubWindow)
         self.recordsSubWindow.setWindowTitle("學生活動紀錄-總數(所有經濟情況)")
-        self.recordsSubWindow.setTableData(['活動名稱', '人數'], db.getStudentEventTable())
         self.recordsSubWindow.show()
-    
+
+        self.pendingDefaultViews = {self.studentsSubWindow, self.eventsSubWindow, self.recordsSubWindow}
+        for subWindow in self.pendingDefaultViews:
+            subWindow.dataLoaded.connect(lambda subWindow=subWindow: self.onDefaultViewLoaded(subWindow))
+        self.firstPaintDone = False
+
+        startupTimer.mark('main_window_built')
+        self.show()
+        if not deferred:
+            self.loadDefaultSubWindows()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.firstPaintDone:
+            self.firstPaintDone = True
+            startupTimer.mark('first_paint')
+            if self.deferred:
+                # Queue the loading behind the paint events of this round, so the empty window shows up first
+                QTimer.singleShot(0, self.loadDefaultSubWindows)
+
+    def loadDefaultSubWindows(self):
+        self.loadStudents()
+        self.loadEvents()
+        self.loadRecords()
+
+    def loadStudents(self):
+        # Keeps the current search, the category names come from the query
+        self.fillTable(self.studentsSubWindow, StudentSearchMDITableWidget.HEADER, self.studentsSubWindow.searchQuery())
+
+    def loadEvents(self):
+        self.fillTable(self.eventsSubWindow, ['活動名稱'], db.getAllEventsQuery())
+
+    def loadRecords(self):
+        self.fillTable(self.recordsSubWindow, ['活動名稱', '人數'], db.getStudentEventTableQuery())
+
+    def fillTable(self, subWindow, horizontal_header, query, formatters=None):
+        if self.deferred:
+            subWindow.runTableQuery(horizontal_header, query, formatters)
+        else:
+            subWindow.setTableQuery(horizontal_header, query, formatters)
+
+    def onDefaultViewLoaded(self, subWindow):
+        if subWindow not in self.pendingDefaultViews:
+            return
+        self.pendingDefaultViews.discard(subWindow)
+        if not self.pendingDefaultViews:
+            elapsed = startupTimer.mark('default_views_loaded')
+            self.statusbar.showMessage(f"Ready in {elapsed:.0f} ms", 5000)
+            if os.environ.get('LKM_STARTUP_LOG'):
+                startupTimer.write(os.environ['LKM_STARTUP_LOG'])
+
+    def showStudentInfoInput(self):
+        if self.studentInfoWidget is None:
+            self.studentInfoWidget = StudentInfoInputDialog()
+        self.studentInfoWidget.show()
+
+    def showEventInfoInput(self):
+        if self.eventInfoWidget is None:
+            self.eventInfoWidget = EventInfoInputDialog()
+        self.eventInfoWidget.show()
+
     def dataEditor(self):
         self.tableEditDialog = DataEditDialog()
         self.tableEditDialog.show()
@@ -325,19 +669,109 @@ class MainWindow(QMainWindow, Ui_MainWindow, Observer, metaclass=MainWindowMeta)
         self.studentEventTableWithCategorySubWindow = MDITableWidget()
         self.mdiArea.addSubWindow(self.studentEventTableWithCategorySubWindow)
         self.studentEventTableWithCategorySubWindow.setWindowTitle("活動紀錄-總數(經濟情況-" + categoryMap[cat] + ")")
-        self.studentEventTableWithCategorySubWindow.setTableData(['活動名稱', '人數'], db.getStudentEventTable(cat))
+        self.studentEventTableWithCategorySubWindow.runTableQuery(['活動名稱', '人數'], db.getStudentEventTableQuery(cat))
         self.studentEventTableWithCategorySubWindow.show()
 
     def studentEventTableWithCategoryAndName(self):
         cat = self.categoryPicker()
         if cat == None:
             return
-        self.studentEventTableWithCategoryAndNameSubWindow = MDITableWidget()
+        self.studentEventTableWithCategoryAndNameSubWindow = DrillDownMDIWidget()
         self.mdiArea.addSubWindow(self.studentEventTableWithCategoryAndNameSubWindow)
         self.studentEventTableWithCategoryAndNameSubWindow.setWindowTitle("活動紀錄-姓名(經濟情況-" + categoryMap[cat] + ")")
-        self.studentEventTableWithCategoryAndNameSubWindow.setTableData(['活動名稱', '學生姓名'], db.getEventParticipantWithNames(cat))
+        # Events with their number of participants, the names are paged in when an event is expanded
+        self.studentEventTableWithCategoryAndNameSubWindow.setDrillDown(
+            ['活動名稱', '人數', '班別', '學號', '學生姓名'], db.getEventParticipantCountsQuery(cat),
+            lambda eid, after, limit: db.getEventParticipantsPage(eid, cat, after, limit), 1, 2,
+            ['活動名稱', '學生姓名'], db.getEventParticipantWithNamesQuery(cat)
+        )
         self.studentEventTableWithCategoryAndNameSubWindow.show()
 
+    def categoryCrosstab(self):
+        categories = [cat for cat in categoryMap if cat != 'all']
+        self.categoryCrosstabSubWindow = MDITableWidget()
+        self.mdiArea.addSubWindow(self.categoryCrosstabSubWindow)
+        self.categoryCrosstabSubWindow.setWindowTitle("活動紀錄-總數(各經濟情況)")
+        self.categoryCrosstabSubWindow.runTableQuery(
+            ['活動名稱', *(categoryMap[cat] for cat in categories), '總數'],
+            db.getEventCategoryCrosstabQuery(categories)
+        )
+        self.categoryCrosstabSubWindow.show()
+
+    def studentYearlyCounts(self):
+        # Archives are attached to the main connection for this report, so it runs here rather than on the query executor
+        try:
+            years, rows = db.getStudentsYearlyCounts(current_label='本年度')
+        except (sqlite3.Error, OSError, ValueError) as e:
+            SimpleDialog("Query Failed", str(e), QMessageBox.Warning)
+            return
+        self.studentYearlyCountsSubWindow = MDITableWidget()
+        self.mdiArea.addSubWindow(self.studentYearlyCountsSubWindow)
+        self.studentYearlyCountsSubWindow.setWindowTitle("學生歷年活動次數")
+        self.studentYearlyCountsSubWindow.setTableData(['班別', '學號', '姓名', *years], rows)
+        self.studentYearlyCountsSubWindow.show()
+
+    def archiveSchoolYear(self):
+        today = date.today()
+        start = today.year if today.month >= 9 else today.year - 1
+        year_label, ok = QInputDialog.getText(self, "Archive School Year", "School year to close:", text=f"{start}-{(start + 1) % 100:02d}")
+        if not ok or not year_label.strip():
+            return
+        reply = QMessageBox.question(self, "Archive School Year",
+                                     f"All events and records will be moved to the archive of {year_label.strip()}, students are kept. Continue?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.No:
+            return
+        try:
+            archive_path = db.archiveYear(year_label)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            SimpleDialog("Archive Failed", str(e), QMessageBox.Warning)
+            return
+        with dbAnnouncer.batch():
+            dbAnnouncer.notify('event_added')
+            dbAnnouncer.notify('record_added')
+        SimpleDialog("Archive Successful", f"The school year {year_label.strip()} has been archived to:\n{archive_path}")
+
+    def backupNow(self):
+        backupThread = self.backupScheduler.snapshot()
+        if backupThread is None:
+            SimpleDialog("Backup", "A backup is already running.")
+            return
+        progressDialog = QProgressDialog("Backing up the database...", "Cancel", 0, 0, self)
+        progressDialog.setWindowTitle("Backup")
+        progressDialog.setWindowModality(Qt.WindowModal)
+        progressDialog.setMinimumDuration(500)
+        backupThread.progress.connect(lambda copied, total: (progressDialog.setMaximum(total), progressDialog.setValue(copied)))
+        backupThread.finished.connect(progressDialog.reset)
+        progressDialog.canceled.connect(backupThread.cancel)
+
+    def restoreBackup(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Restore Backup", BACKUP_DIR, "SQLite Database (*.db)")
+        if not file_name:
+            return
+        reply = QMessageBox.question(self, "Restore Backup",
+                                     f"All current data will be replaced by the backup {os.path.basename(file_name)}. "
+                                     "A snapshot of the current data is taken first. Continue?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.No:
+            return
+        try:
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            backupDatabase(db.conn, snapshotPath(BACKUP_DIR, db.db_name), pages=-1)
+            db.restoreFrom(file_name)
+        except (sqlite3.Error, OSError) as e:
+            SimpleDialog("Restore Failed", str(e), QMessageBox.Warning)
+            return
+        with dbAnnouncer.batch():
+            dbAnnouncer.notify('student_added')
+            dbAnnouncer.notify('event_added')
+            dbAnnouncer.notify('record_added')
+        SimpleDialog("Restore Successful", f"The database has been restored from {os.path.basename(file_name)}.")
+
+    def closeEvent(self, event):
+        self.backupScheduler.shutdown()
+        super().closeEvent(event)
+
     def studentParticipates(self):
         cat = self.categoryPicker()
         if cat == None:
@@ -345,26 +779,31 @@ class MainWindow(QMainWindow, Ui_MainWindow, Observer, metaclass=MainWindowMeta)
         self.studentParticipatesSubWindow = MDITableWidget()
         self.mdiArea.addSubWindow(self.studentParticipatesSubWindow)
         self.studentParticipatesSubWindow.setWindowTitle("學生活動紀錄-個人(所有活動)-經濟情況(" + categoryMap[cat] + ")")
-        self.studentParticipatesSubWindow.setTableData(['班別','學號','姓名','參與活動數目'], db.getStudentsEventCounts(cat))
+        self.studentParticipatesSubWindow.runTableQuery(['班別','學號','姓名','參與活動數目'], db.getStudentsEventCountsQuery(cat))
         self.studentParticipatesSubWindow.show()
 
     def studentParticipatesByEvents(self):
         cat = self.categoryPicker()
         if cat == None:
             return
-        self.studentParticipatesByEventsSubWindow = MDITableWidget()
+        self.studentParticipatesByEventsSubWindow = DrillDownMDIWidget()
         self.mdiArea.addSubWindow(self.studentParticipatesByEventsSubWindow)
         self.studentParticipatesByEventsSubWindow.setWindowTitle("學生活動紀錄-個人(所有活動)-經濟情況(" + categoryMap[cat] + ")")
-        self.studentParticipatesByEventsSubWindow.setTableData(['班別','學號','姓名','參與活動'], db.getStudentsEventsParticipated(cat))
+        # Students with their number of events, the event names are paged in when a student is expanded
+        self.studentParticipatesByEventsSubWindow.setDrillDown(
+            ['班別', '學號', '姓名', '參與活動數目', '參與活動'], db.getStudentEventCountsWithIdsQuery(cat),
+            db.getStudentEventsPage, 3, 4,
+            ['班別', '學號', '姓名', '參與活動'], db.getStudentsEventsParticipatedQuery(cat)
+        )
         self.studentParticipatesByEventsSubWindow.show()
 
     def notifyUpdate(self, event_type, *args, **kwargs):
         if event_type == 'student_added':
-            self.studentsSubWindow.setTableData(['班別','學號','姓名','經濟情況'], db.getAllStudents())
+            self.loadStudents()
         elif event_type == 'event_added':
-            self.eventsSubWindow.setTableData(['活動名稱'], db.getAllEvents())
+            self.loadEvents()
         elif event_type == 'record_added':
-            self.recordsSubWindow.setTableData(['活動名稱', '人數'], db.getStudentEventTable())
+            self.loadRecords()
 
     def showAbout(self):
         about_dialog = QMessageBox(self)
@@ -407,11 +846,19 @@ class MainWindow(QMainWindow, Ui_MainWindow, Observer, metaclass=MainWindowMeta)
             return None
 
 if __name__ == '__main__':
+    startupTimer.mark('imports')
     app = QApplication(sys.argv)
-    db = Database("database.db")
+    db = Database("database.db", profile='interactive')
     if not db.checkIfInitialized():
         db.initializeDB()
         SimpleDialog("Database Initialized", "The database has been initialized.")
+    else:
+        db.migrate()
+    queryExecutor = QueryExecutor(db.openReadConnection)
+    startupTimer.mark('database_opened')
+    # Opt-in slow-query log, e.g. LKM_SLOW_QUERY_LOG=slow_queries.log, with LKM_SLOW_QUERY_MS as the threshold
+    if os.environ.get('LKM_SLOW_QUERY_LOG'):
+        db.enableInstrumentation(slow_ms=float(os.environ.get('LKM_SLOW_QUERY_MS', 100)), log_path=os.environ['LKM_SLOW_QUERY_LOG'])
 
     main_window = MainWindow()
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Export every report for every category to CSV files without the GUI.
+
+    python batch_reports.py database.db --output-dir reports
+    python batch_reports.py database.db --reports event_totals event_names --categories F H --workers 4
+
+The category x report matrix is spread over a pool of worker processes, each reading through its own read-only connection.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from src.database import Database, MIGRATIONS, applyConnectionProfile
+from src.formatting import CATEGORY_NAMES, formatRow
+
+# Report name -> (header, name of the Database query builder, whether it takes a category); the headers match the GUI reports
+REPORTS = {
+    'student_event_counts': (['班別', '學號', '姓名', '參與活動數目'], 'getStudentsEventCountsQuery', True),
+    'student_events': (['班別', '學號', '姓名', '參與活動'], 'getStudentsEventsParticipatedQuery', True),
+    'event_totals': (['活動名稱', '人數'], 'getStudentEventTableQuery', True),
+    'event_names': (['活動名稱', '學生姓名'], 'getEventParticipantWithNamesQuery', True),
+    'event_category_crosstab': (['活動名稱', *(CATEGORY_NAMES[cat] for cat in CATEGORY_NAMES if cat != 'all'), '總數'], 'getEventCategoryCrosstabQuery', False),
+}
+
+CHUNK_SIZE = 1000
+
+# The read-only connection of a worker process, opened once by initWorker
+workerConnection : sqlite3.Connection = None
+
+def initWorker(uri):
+    global workerConnection
+    workerConnection = sqlite3.connect(uri, uri=True)
+    applyConnectionProfile(workerConnection, 'reporting')
+
+def exportReport(query, header, file_name, encoding):
+    """
+    Run one report query on the worker's connection and stream it into a CSV file, return (file name, rows written, seconds)
+    """
+    start = time.perf_counter()
+    cursor = workerConnection.execute(*query)
+    written = 0
+    with open(file_name, 'w', newline='', encoding=encoding) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        while rows := cursor.fetchmany(CHUNK_SIZE):
+            writer.writerows(formatRow(row) for row in rows)
+            written += len(rows)
+    return file_name, written, time.perf_counter() - start
+
+def buildJobs(db, reports, categories, output_dir):
+    """
+    Get the (query, header, file name) of every report and category to export
+    """
+    jobs = []
+    for name in reports:
+        header, builder, per_category = REPORTS[name]
+        if per_category:
+            for category in categories:
+                jobs.append((getattr(db, builder)(category), header, os.path.join(output_dir, f'{name}_{category}.csv')))
+        else:
+            jobs.append((getattr(db, builder)(), header, os.path.join(output_dir, f'{name}.csv')))
+    return jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export every report for every category to CSV files, without the GUI.")
+    parser.add_argument('database', nargs='?', default='database.db')
+    parser.add_argument('--output-dir', default='reports', help="directory the CSV files are written to")
+    parser.add_argument('--reports', nargs='+', choices=list(REPORTS), default=list(REPORTS))
+    parser.add_argument('--categories', nargs='+', choices=list(CATEGORY_NAMES), default=list(CATEGORY_NAMES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, the default is one per CPU")
+    parser.add_argument('--encoding', default='utf-8', help="encoding of the CSV files, e.g. utf-8-sig for Excel")
+    options = parser.parse_args(argv)
+
+    if not os.path.exists(options.database):
+        print(f"Database {options.database} not found", file=sys.stderr)
+        return 1
+    db = Database(options.database, profile='reporting')
+    if db.getSchemaVersion() < len(MIGRATIONS):
+        # The reports read tables added by migrations, bring older files up to date like the app does on start
+        db.migrate()
+    os.makedirs(options.output_dir, exist_ok=True)
+    jobs = buildJobs(db, options.reports, options.categories, options.output_dir)
+    db.conn.close()
+
+    start = time.perf_counter()
+    uri = Path(options.database).resolve().as_uri() + '?mode=ro'
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(options.workers, len(jobs))), initializer=initWorker, initargs=(uri,)) as pool:
+        futures = {pool.submit(exportReport, query, header, file_name, options.encoding): file_name for query, header, file_name in jobs}
+        for future in as_completed(futures):
+            try:
+                file_name, written, seconds = future.result()
+            except (sqlite3.Error, OSError) as e:
+                failures += 1
+                print(f"FAILED {futures[future]}: {e}", file=sys.stderr)
+                continue
+            print(f"{file_name}: {written} rows in {seconds:.2f} s")
+    print(f"{len(jobs) - failures} of {len(jobs)} reports written to {options.output_dir} in {time.perf_counter() - start:.2f} s")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    # Worker processes of a PyInstaller build start through this entry point too
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Time every public Database method against generated datasets of increasing size and write a JSON report.
+
+    python -m benchmarks.bench_database --scales 1000 10000 100000 --output bench.json
+    python -m benchmarks.bench_database --baseline old.json --output new.json
+
+With --baseline, methods that got slower than the threshold ratio are listed, so regressions are visible before a release.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmarks.datagen import generateDatabase
+from src.database import Database
+
+# Helpers that are not queries of their own or that change the connection or schema
+SKIPPED = {'useProfile', 'openReadConnection', 'fetchAllCached', 'initializeDB', 'migrate', 'enableInstrumentation', 'disableInstrumentation',
+           'archiveYear', 'attachArchives', 'restoreFrom'}
+
+def sampleContext(db):
+    """
+    Pick existing ids and names from the database, used as arguments of the benchmarked methods
+    """
+    sid, class_name, class_number, std_name, form = db.conn.execute('''
+        SELECT sid, class, class_number, std_name, form FROM student_details ORDER BY sid LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM students)
+    ''').fetchone()
+    eid, event_name = db.conn.execute('''
+        SELECT events.eid, event_name FROM events JOIN records ON events.eid = records.eid
+        GROUP BY events.eid ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()
+    rid = db.conn.execute('SELECT MAX(rid) FROM records').fetchone()[0]
+    roster = db.conn.execute('SELECT class, class_number, std_name FROM student_details LIMIT 400').fetchall()
+    form_sids = [row[0] for row in db.conn.execute('SELECT sid FROM student_details WHERE form = ?', (form,))]
+    return {
+        'sid': sid, 'eid': eid, 'rid': rid, 'class_name': class_name, 'class_number': class_number,
+        'std_name': std_name, 'event_name': event_name, 'category': 'F', 'form': str(form), 'roster': roster,
+        'form_sids': form_sids,
+    }
+
+# Arguments of methods that take any, as a function of the sample context.
+# Methods missing from here are reported as skipped, so newly added methods show up in the report.
+ARGUMENTS = {
+    'findSid': lambda c: (c['class_name'], c['class_number'], c['std_name']),
+    'findEid': lambda c: (c['event_name'],),
+    'isEventExists': lambda c: (c['event_name'],),
+    'getNumberOfParticipants': lambda c: (c['eid'], c['category']),
+    'getStudentEventCounts': lambda c: (c['sid'],),
+    'getStudentEventList': lambda c: (c['sid'],),
+    'getStudentsByForm': lambda c: (c['form'],),
+    'getStudentParticipationTrend': lambda c: (c['sid'],),
+    # The first page of the drill-down reports, the event is the one with the most participants
+    'getEventParticipantsPage': lambda c: (c['eid'],),
+    'getStudentEventsPage': lambda c: (c['sid'],),
+    'hasTable': lambda c: ('students',),
+    'searchStudents': lambda c: (c['std_name'],),
+    'addStudent': lambda c: ('9Z', 1, '測試', 'F'),
+    'addStudents': lambda c: ([('9Z', n, '測試', 'F') for n in range(1, 501)],),
+    'addEvent': lambda c: ('benchmark event',),
+    'addEventWithReturn': lambda c: ('benchmark event',),
+    'addRecord': lambda c: (c['sid'], c['eid']),
+    'enrollStudents': lambda c: (c['eid'], c['roster']),
+    # Every line with its name reversed, the worst case of a messy paste
+    'suggestRosterMatches': lambda c: ([(index, class_name, class_number, std_name[::-1]) for index, (class_name, class_number, std_name) in enumerate(c['roster'])],),
+    'removeStudent': lambda c: (c['sid'],),
+    'removeEvent': lambda c: (c['eid'],),
+    'removeRecord': lambda c: (c['rid'],),
+    'removeRecordByEid': lambda c: (c['eid'],),
+    'removeRecordBySid': lambda c: (c['sid'],),
+    'removeStudents': lambda c: (c['form_sids'],),
+    'removeEvents': lambda c: ([c['eid']],),
+    'removeRecords': lambda c: (list(range(1, 1001)),),
+    # A graduating form leaving the school
+    'applyChanges': lambda c: ({('students', 'delete'): c['form_sids']},),
+}
+# Report methods are also timed once per category, the 'all' run uses the default argument
+CATEGORY_METHODS = {'getStudentsEventCounts', 'getStudentsEventsParticipated', 'getStudentEventTable', 'getEventParticipantWithNames'}
+
+def publicMethods():
+    for name, member in inspect.getmembers(Database, inspect.isfunction):
+        if name.startswith('_') or name in SKIPPED or name.endswith('Query'):
+            continue
+        yield name, member
+
+def isMutating(method):
+    # Methods wrapped by @mutating keep the original under __wrapped__
+    return hasattr(method, '__wrapped__')
+
+def timeCall(call, repeat, prepare=None):
+    """
+    Run call repeat times and return (timings in ms, result of the last call); prepare runs untimed before every call
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+def summarize(timings, result, args):
+    entry = {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(min(timings), 4),
+        'max_ms': round(max(timings), 4),
+        'runs': len(timings),
+        'args': repr(args) if len(repr(args)) <= 80 else repr(args)[:77] + '...',
+    }
+    if isinstance(result, list):
+        entry['rows'] = len(result)
+    return entry
+
+def benchmarkScale(records, workdir, repeat, seed):
+    path = os.path.join(workdir, f'bench_{records}.db')
+    start = time.perf_counter()
+    dataset = generateDatabase(path, records, seed=seed)
+    dataset['generate_seconds'] = round(time.perf_counter() - start, 3)
+    del dataset['path']
+    dataset['file_bytes'] = os.path.getsize(path)
+
+    db = Database(path)
+    context = sampleContext(db)
+    methods = {}
+    for name, member in publicMethods():
+        argsFor = ARGUMENTS.get(name)
+        required = [p for p in list(inspect.signature(member).parameters.values())[1:] if p.default is p.empty and p.kind is p.POSITIONAL_OR_KEYWORD]
+        if argsFor is None and required:
+            methods[name] = {'skipped': 'no benchmark arguments defined'}
+            continue
+        args = argsFor(context) if argsFor else ()
+
+        if isMutating(member):
+            # Every run of a write gets a fresh copy of the dataset, so runs do not see each other's changes
+            db.conn.close()
+            copyPath = path + '.write'
+            target = {}
+            def prepare():
+                if 'db' in target:
+                    target['db'].conn.close()
+                shutil.copyfile(path, copyPath)
+                target['db'] = Database(copyPath)
+            try:
+                timings, result = timeCall(lambda: getattr(target['db'], name)(*args), repeat, prepare)
+                methods[name] = summarize(timings, result, args)
+            except sqlite3.Error as e:
+                methods[name] = {'error': str(e)}
+            finally:
+                target['db'].conn.close()
+                os.remove(copyPath)
+            db = Database(path)
+            continue
+
+        variants = [(name, args)]
+        if name in CATEGORY_METHODS:
+            variants += [(f'{name}[{cat}]', (cat,)) for cat in 'CFHDS']
+        for label, variantArgs in variants:
+            try:
+                # Clear the result cache so the SQL itself is timed, not a cache hit
+                timings, result = timeCall(lambda: getattr(db, name)(*variantArgs), repeat, db.resultCache.clear)
+                methods[label] = summarize(timings, result, variantArgs)
+            except sqlite3.Error as e:
+                methods[label] = {'error': str(e)}
+
+    db.conn.close()
+    os.remove(path)
+    return {'dataset': dataset, 'methods': methods}
+
+def compareReports(baseline, current, threshold):
+    """
+    List (scale, method, baseline ms, current ms, ratio) for methods whose median got slower than threshold times the baseline
+    """
+    regressions = []
+    baselineScales = {scale['dataset']['records']: scale for scale in baseline['scales']}
+    for scale in current['scales']:
+        old = baselineScales.get(scale['dataset']['records'])
+        if old is None:
+            continue
+        for name, entry in scale['methods'].items():
+            oldEntry = old['methods'].get(name, {})
+            if 'median_ms' not in entry or 'median_ms' not in oldEntry or oldEntry['median_ms'] <= 0:
+                continue
+            ratio = entry['median_ms'] / oldEntry['median_ms']
+            if ratio > threshold:
+                regressions.append((scale['dataset']['records'], name, oldEntry['median_ms'], entry['median_ms'], round(ratio, 2)))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every public Database method on generated school data.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000], help="numbers of records to generate")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per method")
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--workdir', help="directory for the generated databases, a temporary one by default")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    options = parser.parse_args(argv)
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='lkm_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': options.seed,
+            'repeat': options.repeat,
+        },
+        'scales': [],
+    }
+    for records in options.scales:
+        print(f"Benchmarking {records} records...", file=sys.stderr)
+        report['scales'].append(benchmarkScale(records, workdir, options.repeat, options.seed))
+    if not options.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            regressions = compareReports(json.load(f), report, options.threshold)
+        for records, name, old, new, ratio in regressions:
+            print(f"REGRESSION {records} records {name}: {old} ms -> {new} ms (x{ratio})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Time the GUI end to end against generated datasets of increasing size and write a JSON report.
+Every report handler of MainWindow is timed from the button press until its table is filled, laid out and painted,
+with the time spent in setTableData and its resizeColumnsToContents and resizeRowsToContents calls broken out.
+
+    python -m benchmarks.bench_gui --scales 1000 10000 100000 --output bench_gui.json
+    python -m benchmarks.bench_gui --baseline old.json --output new.json
+
+It runs headless on the offscreen Qt platform unless QT_QPA_PLATFORM is set otherwise.
+"""
+import os
+# Before Qt is imported: no display needed, and no automatic snapshots of the benchmark databases
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ.setdefault('LKM_BACKUP_INTERVAL_MIN', '0')
+
+import argparse
+import json
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from PySide6 import __version__ as PYSIDE_VERSION
+from PySide6.QtCore import QEventLoop, QTimer
+from PySide6.QtWidgets import QApplication, QTableView
+from benchmarks.bench_database import compareReports
+from benchmarks.datagen import generateDatabase
+import app
+
+# Report handler -> (whether it asks for a category, attribute of MainWindow holding the window it fills)
+HANDLERS = {
+    'loadStudents': (False, 'studentsSubWindow'),
+    'loadEvents': (False, 'eventsSubWindow'),
+    'loadRecords': (False, 'recordsSubWindow'),
+    'studentParticipates': (True, 'studentParticipatesSubWindow'),
+    'studentParticipatesByEvents': (True, 'studentParticipatesByEventsSubWindow'),
+    'studentEventTableWithCategory': (True, 'studentEventTableWithCategorySubWindow'),
+    'studentEventTableWithCategoryAndName': (True, 'studentEventTableWithCategoryAndNameSubWindow'),
+    'categoryCrosstab': (False, 'categoryCrosstabSubWindow'),
+    'studentYearlyCounts': (False, 'studentYearlyCountsSubWindow'),
+}
+# Windows the main window keeps, the others are closed after every run
+DEFAULT_WINDOWS = {'studentsSubWindow', 'eventsSubWindow', 'recordsSubWindow'}
+
+class FillTimer:
+    """
+    Accumulates the time spent in the table fill and layout calls while it is installed
+    """
+    PATCHED = [
+        (app.MDITableWidget, 'setTableData', 'fill_ms'),
+        (app.DrillDownMDIWidget, 'setTableData', 'fill_ms'),
+        (QTableView, 'resizeColumnsToContents', 'resize_columns_ms'),
+        (QTableView, 'resizeRowsToContents', 'resize_rows_ms'),
+    ]
+
+    def __init__(self):
+        self.phases = {}
+
+    def reset(self):
+        self.phases = {phase: 0.0 for _, _, phase in self.PATCHED}
+
+    def _wrap(self, original, phase):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.phases[phase] += (time.perf_counter() - start) * 1000
+        return timed
+
+    @contextmanager
+    def installed(self):
+        originals = [(owner, name, owner.__dict__[name]) for owner, name, _ in self.PATCHED]
+        self.reset()
+        try:
+            for owner, name, phase in self.PATCHED:
+                setattr(owner, name, self._wrap(owner.__dict__[name], phase))
+            yield self
+        finally:
+            for owner, name, original in originals:
+                setattr(owner, name, original)
+
+def processUntil(qa, done, timeout=120):
+    """
+    Process events until done() holds, then once more so the resulting layout and paint events are handled
+    """
+    deadline = time.perf_counter() + timeout
+    # Block until the next event instead of spinning, which would take the CPU from the query threads; the timer bounds the wait
+    wakeUp = QTimer()
+    wakeUp.start(100)
+    try:
+        while not done():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("The GUI did not finish in time")
+            qa.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents)
+    finally:
+        wakeUp.stop()
+    qa.processEvents()
+
+def summarize(timings, phases, rows):
+    entry = {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'runs': len(timings),
+    }
+    for phase, values in phases.items():
+        entry[phase] = round(statistics.median(values), 3)
+    if rows is not None:
+        # Top-level rows in the model once the window is painted, paged models only hold their first page by then
+        entry['rows_loaded'] = rows
+    return entry
+
+def timeStartup(qa, repeat):
+    """
+    Time building MainWindow, its first paint and the loading of the default windows, the window of the last run is returned open
+    """
+    phases = {'construct_ms': [], 'first_paint_ms': []}
+    timings = []
+    window = None
+    for _ in range(repeat):
+        if window is not None:
+            closeMainWindow(window)
+        app.db.resultCache.clear()
+        start = time.perf_counter()
+        window = app.MainWindow()
+        phases['construct_ms'].append((time.perf_counter() - start) * 1000)
+        processUntil(qa, lambda: window.firstPaintDone)
+        phases['first_paint_ms'].append((time.perf_counter() - start) * 1000)
+        processUntil(qa, lambda: not window.pendingDefaultViews)
+        timings.append((time.perf_counter() - start) * 1000)
+    return window, summarize(timings, phases, None)
+
+def timeHandler(qa, window, name, category, repeat):
+    """
+    Time one report handler from the call until its window is filled and painted, the result cache is cleared before every run
+    """
+    asksCategory, attribute = HANDLERS[name]
+    if asksCategory:
+        window.categoryPicker = lambda: category
+    fillTimer = FillTimer()
+    timings = []
+    phases = {}
+    rows = None
+    with fillTimer.installed():
+        for _ in range(repeat):
+            app.db.resultCache.clear()
+            fillTimer.reset()
+            start = time.perf_counter()
+            getattr(window, name)()
+            widget = getattr(window, attribute)
+            processUntil(qa, lambda: widget.pendingTask is None)
+            timings.append((time.perf_counter() - start) * 1000)
+            for phase, value in fillTimer.phases.items():
+                phases.setdefault(phase, []).append(value)
+            model = widget.treeView.model() if isinstance(widget, app.DrillDownMDIWidget) else widget.tableWidget.model()
+            rows = model.rowCount() if model is not None else 0
+            if attribute not in DEFAULT_WINDOWS:
+                widget.parentWidget().close()
+                widget.parentWidget().deleteLater()
+                qa.processEvents()
+    return summarize(timings, phases, rows)
+
+def closeMainWindow(window):
+    window.backupScheduler.shutdown()
+    app.dbAnnouncer.unregister(window)
+    window.close()
+    window.deleteLater()
+
+def benchmarkScale(qa, records, workdir, repeat, seed, categories):
+    path = os.path.join(workdir, f'bench_gui_{records}.db')
+    start = time.perf_counter()
+    dataset = generateDatabase(path, records, seed=seed)
+    dataset['generate_seconds'] = round(time.perf_counter() - start, 3)
+    del dataset['path']
+    dataset['file_bytes'] = os.path.getsize(path)
+
+    # The app works on module globals, set up the way its __main__ does
+    app.db = app.Database(path, profile='interactive')
+    app.queryExecutor = app.QueryExecutor(app.db.openReadConnection)
+    methods = {}
+    window = None
+    try:
+        window, methods['startup'] = timeStartup(qa, repeat)
+        for name, (asksCategory, _) in HANDLERS.items():
+            for category in (categories if asksCategory else ['all']):
+                label = name if category == 'all' else f'{name}[{category}]'
+                try:
+                    methods[label] = timeHandler(qa, window, name, category, repeat)
+                except (sqlite3.Error, TimeoutError) as e:
+                    methods[label] = {'error': str(e)}
+    finally:
+        if window is not None:
+            closeMainWindow(window)
+        qa.processEvents()
+        app.queryExecutor.waitForDone()
+        app.db.conn.close()
+        os.remove(path)
+    return {'dataset': dataset, 'methods': methods}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MainWindow startup and every report handler on generated school data.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000], help="numbers of records to generate")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per handler")
+    parser.add_argument('--categories', nargs='+', choices=list(app.categoryMap), default=['all', 'F'],
+                        help="categories to run the handlers that ask for one with")
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--workdir', help="directory for the generated databases, a temporary one by default")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    options = parser.parse_args(argv)
+
+    qa = QApplication.instance() or QApplication([])
+    workdir = options.workdir or tempfile.mkdtemp(prefix='lkm_bench_gui_')
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'pyside': PYSIDE_VERSION,
+            'qpa_platform': qa.platformName(),
+            'platform': platform.platform(),
+            'seed': options.seed,
+            'repeat': options.repeat,
+        },
+        'scales': [],
+    }
+    for records in options.scales:
+        print(f"Benchmarking the GUI with {records} records...", file=sys.stderr)
+        report['scales'].append(benchmarkScale(qa, records, workdir, options.repeat, options.seed, options.categories))
+    if not options.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            regressions = compareReports(json.load(f), report, options.threshold)
+        for records, name, old, new, ratio in regressions:
+            print(f"REGRESSION {records} records {name}: {old} ms -> {new} ms (x{ratio})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
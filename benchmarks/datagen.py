@@ -0,0 +1,104 @@
+"""
+Seeded generator of realistic school datasets, written through the real Database schema.
+
+The same seed and parameters always produce the same database, so timings from different runs are comparable.
+"""
+import heapq
+import math
+import os
+import random
+from src.database import Database
+
+SURNAMES = '陳李張黃何林吳劉蔡楊梁鄭謝郭曾羅馮鄧葉蕭'
+GIVEN_CHARS = '家俊子軒嘉欣詠琳志明偉文浩然思穎曉彤樂天卓賢凱婷雅詩宇豪鈞晴'
+CLASS_LETTERS = 'ABCDEFGH'
+# Share of students in each financial-assistance category
+CATEGORY_WEIGHTS = {'C': 0.10, 'F': 0.45, 'H': 0.25, 'D': 0.15, 'S': 0.05}
+EVENT_KINDS = ['校際比賽', '交流團', '工作坊', '講座', '參觀', '興趣班', '運動會', '音樂會', '服務學習', '領袖訓練']
+
+def randomName(rng):
+    return rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2, 2))))
+
+def generateStudents(rng, forms, classes_per_form, students_per_class):
+    """
+    Generate (class, class_number, std_name, category) rows for forms x classes_per_form x students_per_class students
+    """
+    categories, weights = zip(*CATEGORY_WEIGHTS.items())
+    students = []
+    for form in range(1, forms + 1):
+        for letter in CLASS_LETTERS[:classes_per_form]:
+            for class_number in range(1, students_per_class + 1):
+                students.append((f'{form}{letter}', class_number, randomName(rng), rng.choices(categories, weights)[0]))
+    return students
+
+def generateEventSizes(rng, events, records, max_size):
+    """
+    Split records over events with a heavy-tailed (log-normal) size distribution:
+    most events are small activities, a few (sports day, school picnic) take in a large part of the school.
+    """
+    raw = [rng.lognormvariate(0, 1.2) for _ in range(events)]
+    scale = records / sum(raw)
+    sizes = [max(1, min(max_size, round(value * scale))) for value in raw]
+    # Rounding and the max_size cap move the total away from records, spread the difference over events that have room
+    difference = records - sum(sizes)
+    while difference != 0:
+        index = rng.randrange(events)
+        if difference > 0 and sizes[index] < max_size:
+            sizes[index] += 1
+            difference -= 1
+        elif difference < 0 and sizes[index] > 1:
+            sizes[index] -= 1
+            difference += 1
+    return sizes
+
+def weightedSample(rng, population, weights, k):
+    """
+    Pick k distinct items, each with probability proportional to its weight (Efraimidis-Spirakis)
+    """
+    keyed = ((rng.random() ** (1.0 / weight), item) for item, weight in zip(population, weights))
+    return [item for _, item in heapq.nlargest(k, keyed)]
+
+def generateDatabase(path, records, students=None, events=None, seed=2025):
+    """
+    Create a new database at path holding about the given number of students and events and exactly the given number of records.
+    Students and events default to sizes typical of a school with that much participation data.
+    Return a dict describing the generated dataset.
+    """
+    rng = random.Random(seed)
+    if students is None:
+        students = min(3000, max(200, int(math.sqrt(records) * 8)))
+    if events is None:
+        events = max(10, records // 50)
+
+    forms = 6
+    students_per_class = 30
+    classes_per_form = max(1, min(len(CLASS_LETTERS), math.ceil(students / (forms * students_per_class))))
+    students_per_class = max(1, math.ceil(students / (forms * classes_per_form)))
+    studentRows = generateStudents(rng, forms, classes_per_form, students_per_class)[:students]
+    records = min(records, events * len(studentRows))
+
+    if os.path.exists(path):
+        os.remove(path)
+    db = Database(path, profile='bulk-import')
+    db.initializeDB()
+    db.addStudents(studentRows)
+
+    eventNames = [f'{rng.choice(EVENT_KINDS)} {index + 1:05d}' for index in range(events)]
+    eids = [db.addEventWithReturn(name) for name in eventNames]
+
+    # Some students join far more activities than others
+    activity = [rng.paretovariate(1.5) for _ in studentRows]
+    roster = [row[:3] for row in studentRows]
+    for eid, size in zip(eids, generateEventSizes(rng, events, records, len(studentRows))):
+        unmatched = db.enrollStudents(eid, weightedSample(rng, roster, activity, size))
+        assert not unmatched, unmatched
+
+    db.conn.execute('PRAGMA optimize')
+    db.conn.close()
+    return {
+        'path': path,
+        'seed': seed,
+        'students': len(studentRows),
+        'events': events,
+        'records': records,
+    }
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from PySide6.QtCore import QObject, QThread, QTimer, Signal
+
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+def snapshotPath(directory, db_name, when=None):
+    """
+    Get the path of a snapshot of db_name taken at when, e.g. backups/database_20250701-120000.db
+    """
+    stem = Path(db_name).stem
+    when = when or datetime.now()
+    return str(Path(directory) / f'{stem}_{when.strftime(SNAPSHOT_TIME_FORMAT)}.db')
+
+def listSnapshots(directory, db_name):
+    """
+    Get the paths of the snapshots of db_name in directory, oldest first
+    """
+    stem = Path(db_name).stem
+    snapshots = []
+    for path in Path(directory).glob(f'{stem}_*.db'):
+        try:
+            datetime.strptime(path.stem[len(stem) + 1:], SNAPSHOT_TIME_FORMAT)
+        except ValueError:
+            continue # Not one of ours, e.g. an archive of a school year
+        snapshots.append(str(path))
+    return sorted(snapshots)
+
+def pruneSnapshots(directory, db_name, keep):
+    """
+    Delete all but the newest keep snapshots of db_name, return the deleted paths
+    """
+    snapshots = listSnapshots(directory, db_name)
+    pruned = snapshots[:max(0, len(snapshots) - keep)]
+    for path in pruned:
+        os.remove(path)
+    return pruned
+
+def backupDatabase(source, target_path, pages=256, progress=None, sleep=0.005):
+    """
+    Copy the database of the source connection into a new file at target_path with the online backup API.
+    pages are copied per step and the source is unlocked for sleep seconds between steps, so other connections keep reading and writing.
+    progress(copied, total) is called after every step. The copy is written to a temporary file first and only
+    moved into place once it is complete, so target_path never holds a torn file.
+    """
+    partial = target_path + '.partial'
+    target = sqlite3.connect(partial)
+    try:
+        source.backup(target, pages=pages, sleep=sleep,
+                      progress=None if progress is None else lambda status, remaining, total: progress(total - remaining, total))
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    # The copy inherits WAL mode from the source, a snapshot is a single self-contained file
+    target.execute('PRAGMA journal_mode = DELETE')
+    target.close()
+    os.replace(partial, target_path)
+    return target_path
+
+class BackupThread(QThread):
+    """
+    A thread that takes a snapshot of the database through its own connection, reporting progress as it goes.
+    connect is a callable returning a new sqlite3 connection to back up, it is called from the backup thread itself.
+    """
+    progress = Signal(int, int) # pages copied, total pages
+    failed = Signal(str)
+    succeeded = Signal(str) # path of the snapshot
+
+    def __init__(self, connect, target_path, pages=256, parent=None):
+        super().__init__(parent)
+        self._connect = connect
+        self._targetPath = target_path
+        self._pages = pages
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _onProgress(self, copied, total):
+        self.progress.emit(copied, total)
+        if self._cancelled:
+            # Raising from the progress callback aborts the backup, the partial file is removed by backupDatabase
+            raise InterruptedError("Backup cancelled")
+
+    def run(self):
+        conn = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._targetPath)), exist_ok=True)
+            conn = self._connect()
+            backupDatabase(conn, self._targetPath, self._pages, self._onProgress)
+        except InterruptedError:
+            return
+        except (sqlite3.Error, OSError) as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+        self.succeeded.emit(self._targetPath)
+
+class BackupScheduler(QObject):
+    """
+    Take a snapshot of the database every interval_minutes into directory, keeping the newest keep snapshots.
+    A snapshot is skipped if the previous one is still running.
+    """
+    snapshotTaken = Signal(str)
+    snapshotFailed = Signal(str)
+
+    def __init__(self, connect, db_name, directory, interval_minutes=60, keep=10, parent=None):
+        super().__init__(parent)
+        self._connect = connect
+        self.dbName = db_name
+        self.directory = directory
+        self.keep = keep
+        self._thread = None
+        self._timer = QTimer(self)
+        self._timer.setInterval(int(interval_minutes * 60 * 1000))
+        self._timer.timeout.connect(self.snapshot)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.isRunning()
+
+    def snapshot(self):
+        """
+        Start a snapshot now, return its BackupThread, or None if one is already running
+        """
+        if self.isRunning():
+            return None
+        self._thread = BackupThread(self._connect, snapshotPath(self.directory, self.dbName), parent=self)
+        self._thread.succeeded.connect(self._onSucceeded)
+        self._thread.failed.connect(self.snapshotFailed)
+        self._thread.finished.connect(self._onFinished)
+        self._thread.start()
+        return self._thread
+
+    def _onSucceeded(self, path):
+        pruneSnapshots(self.directory, self.dbName, self.keep)
+        self.snapshotTaken.emit(path)
+
+    def _onFinished(self):
+        # Every snapshot gets a new thread object, delete the finished one so they do not pile up under the scheduler
+        thread = self.sender()
+        if thread is self._thread:
+            self._thread = None
+        thread.deleteLater()
+
+    def waitForDone(self):
+        if self._thread is not None:
+            self._thread.wait()
+
+    def shutdown(self):
+        """
+        Stop scheduling and cancel a running snapshot, waiting for its thread to end
+        """
+        self.stop()
+        if self.isRunning():
+            self._thread.cancel()
+        self.waitForDone()
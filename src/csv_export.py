@@ -0,0 +1,67 @@
+import csv
+import os
+import sqlite3
+from PySide6.QtCore import QThread, Signal
+from src.formatting import formatRow
+
+class CSVExportThread(QThread):
+    """
+    A thread that re-runs a report query on its own connection and streams the rows into a CSV file.
+    Rows are read with fetchmany and written chunk by chunk, so memory use does not grow with the size of the report.
+    connect is a callable returning a new sqlite3 connection, it is called from the export thread itself.
+    total is the number of rows to expect, if the caller already knows it; the report is not counted beforehand, that would run it twice.
+    """
+    progress = Signal(int, int) # rows written, total rows or 0 if not known
+    failed = Signal(str)
+
+    CHUNK_SIZE = 1000
+
+    def __init__(self, connect, query, headers, file_name, formatters=None, total=None, parent=None):
+        super().__init__(parent)
+        self._connect = connect
+        self._query = query
+        self._headers = headers
+        self._fileName = file_name
+        self._formatters = formatters
+        self._total = total or 0
+        self._cancelled = False
+        self._conn = None
+
+    def cancel(self):
+        """
+        Stop the export, the partly written file is removed
+        """
+        self._cancelled = True
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:
+                pass # The export finished and closed its connection meanwhile
+
+    def run(self):
+        sql, params = self._query
+        try:
+            self._conn = self._connect()
+            cursor = self._conn.execute(sql, params)
+            with open(self._fileName, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(self._headers)
+                written = 0
+                while not self._cancelled:
+                    rows = cursor.fetchmany(self.CHUNK_SIZE)
+                    if not rows:
+                        break
+                    writer.writerows(formatRow(row, self._formatters) for row in rows)
+                    written += len(rows)
+                    # The data may have changed since the total was taken, never report more rows written than expected
+                    self.progress.emit(written, max(self._total, written) if self._total else 0)
+        except (sqlite3.Error, OSError) as e:
+            if not self._cancelled:
+                self.failed.emit(str(e))
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        if self._cancelled and os.path.exists(self._fileName):
+            os.remove(self._fileName)
@@ -1,9 +1,191 @@
 import sqlite3
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from src.result_cache import ResultCache
+from src.instrumentation import QueryInstrumentation, InstrumentedCursor, InstrumentedConnection
+from src.roster_index import RosterIndex
+from src.formatting import CATEGORY_NAMES
+
+# Named connection profiles, each maps a PRAGMA to the value it is set to when the profile is applied.
+# A value of None leaves that setting alone. Negative cache_size is in KiB, mmap_size is in bytes, busy_timeout in milliseconds.
+# Foreign keys are not a profile setting, Database always turns them on, see enableForeignKeys.
+CONNECTION_PROFILES = {
+    # The GUI: durable commits in WAL mode, readers never block the writer
+    'interactive': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    # Large imports: bigger cache and mmap, still NORMAL sync, which is the setting a power loss cannot corrupt a WAL database with.
+    # An import is a single transaction, so NORMAL costs one sync per import; OFF would risk the whole file for no real gain
+    'bulk-import': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+    # Read-only report connections: big cache and mmap for scans, temporary b-trees for GROUP BY kept in memory
+    'reporting': {
+        'journal_mode': None,
+        'synchronous': None,
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+}
+
+def applyConnectionProfile(conn, profile):
+    """
+    Apply a connection profile, given by name or as a dict of PRAGMA values, to a sqlite3 connection
+    """
+    settings = CONNECTION_PROFILES[profile] if isinstance(profile, str) else profile
+    for pragma, value in settings.items():
+        if pragma not in CONNECTION_PROFILES['interactive']:
+            raise ValueError(f"Unsupported connection profile setting '{pragma}'")
+        if value is not None:
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+def classForm(class_name):
+    """
+    Get the form of a class from its leading digits, e.g. 1 for 1A and 12 for 12C, None if it does not start with one
+    """
+    digits = ''
+    for char in str(class_name).strip():
+        if not char.isdecimal():
+            break
+        digits += char
+    return int(digits) if digits else None
+
+def mutating(method):
+    """
+    Mark a Database method as one that writes, every call bumps the write generation and so invalidates the result cache
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.writeGeneration += 1
+    return wrapper
+
+def queryBuilder(method):
+    """
+    Mark a Database method as one that builds a (sql, params) query for others to run, e.g. QueryExecutor
+    With instrumentation on, statements running that sql are attributed to the method wherever they run
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        query = method(self, *args, **kwargs)
+        if self.instrumentation is not None:
+            self.instrumentation.nameQuery(query[0], method.__name__)
+        return query
+    return wrapper
 
 class Database:
-    def __init__(self, db_name):
+    def __init__(self, db_name, profile='interactive', cache_size=64):
+        self.db_name = db_name
         self.conn = sqlite3.connect(db_name)
         self.cursor = self.conn.cursor()
+        self.profile = profile
+        applyConnectionProfile(self.conn, profile)
+        self.enableForeignKeys()
+        self.writeGeneration = 0
+        self.resultCache = ResultCache(cache_size)
+        self.rosterIndex = RosterIndex()
+        self.instrumentation = None
+
+    def enableForeignKeys(self):
+        """
+        Turn on foreign keys, which the ON DELETE CASCADE of records relies on; SQLite leaves them off unless every connection asks.
+        They decide whether deletes are correct rather than how fast they are, so no connection profile can turn them off
+        """
+        self.cursor.execute('PRAGMA foreign_keys = ON')
+
+    def getWriteGeneration(self):
+        """
+        Get a value that changes whenever the database is written to
+        Writes through this object bump writeGeneration, PRAGMA data_version catches commits made by other connections
+        """
+        self.cursor.execute('PRAGMA data_version')
+        return (self.writeGeneration, self.cursor.fetchone()[0])
+
+    def fetchAllCached(self, query):
+        """
+        Run a (sql, params) query built by one of the *Query methods on self.cursor and return all its rows
+        The rows are memoized per query, i.e. per report method and its arguments, until the next write
+        """
+        generation = self.getWriteGeneration()
+        rows = self.resultCache.get(query, generation)
+        if rows is None:
+            self.cursor.execute(*query)
+            rows = self.cursor.fetchall()
+            self.resultCache.put(query, generation, rows)
+        # Hand out a copy so callers cannot change the cached list
+        return list(rows)
+
+    @contextmanager
+    def useProfile(self, profile):
+        """
+        Switch the connection to another profile for the duration of the block, e.g. 'bulk-import' around a large import
+        """
+        previous, self.profile = self.profile, profile
+        applyConnectionProfile(self.conn, profile)
+        try:
+            yield self
+        finally:
+            self.profile = previous
+            applyConnectionProfile(self.conn, previous)
+
+    def enableInstrumentation(self, slow_ms=100, log_path=None, max_bytes=1024 * 1024, backup_count=3):
+        """
+        Start timing every statement run through self.cursor, attributed to the Database method that ran it, and through the read
+        connections opened from now on, i.e. the reports of QueryExecutor and CSVExportThread, attributed to their *Query method
+        Statements slower than slow_ms are written with their EXPLAIN QUERY PLAN to a rotating log at log_path, if given
+        Return the QueryInstrumentation collecting the stats
+        """
+        self.instrumentation = QueryInstrumentation(__file__, slow_ms, log_path, max_bytes, backup_count)
+        self.cursor = self.conn.cursor(InstrumentedCursor)
+        self.cursor.instrumentation = self.instrumentation
+        return self.instrumentation
+
+    def disableInstrumentation(self):
+        if isinstance(self.cursor, InstrumentedCursor):
+            self.cursor.finish()
+        self.cursor = self.conn.cursor()
+        self.instrumentation = None
+
+    def getRosterIndex(self):
+        """
+        Get the in-memory (class, class_number, std_name) -> sid index, loading it first if needed
+        """
+        return self.rosterIndex.ensureLoaded(self.conn)
+
+    def getQueryStats(self):
+        """
+        Get the aggregated statement stats per method, an empty dict if instrumentation is off
+        """
+        if self.instrumentation is None:
+            return {}
+        self.cursor.finish()
+        return self.instrumentation.getStats()
+
+    def openReadConnection(self, profile='reporting'):
+        """
+        Open a new read-only connection to the same database file
+        sqlite3 connections must stay in the thread that opened them, so call this from the thread or process that will use it
+        """
+        conn = sqlite3.connect(Path(self.db_name).resolve().as_uri() + '?mode=ro', uri=True, factory=InstrumentedConnection)
+        applyConnectionProfile(conn, profile)
+        # Set after the profile so its PRAGMAs are not counted
+        conn.instrumentation = self.instrumentation
+        return conn
 
     def checkIfInitialized(self):
         """
@@ -23,6 +205,7 @@ class Database:
         ''')
         return self.cursor.fetchone()[0] > 0
     
+    @mutating
     def initializeDB(self):
         """
         Initialize the database with the necessary tables
@@ -49,20 +232,18 @@ class Database:
             sid INTEGER NOT NULL,
             eid INTEGER NOT NULL,
             status TEXT DEFAULT '1',
-            FOREIGN KEY (sid) REFERENCES students(sid),
-            FOREIGN KEY (eid) REFERENCES event(eid)
+            FOREIGN KEY (sid) REFERENCES students(sid) ON DELETE CASCADE,
+            FOREIGN KEY (eid) REFERENCES events(eid) ON DELETE CASCADE
             )
         ''')
         self.conn.commit()
+        self.migrate()
 
     def findSid(self, class_name, class_number, std_name):
         """
-        Find the student id given their class, class number and std_name
+        Find the student id given their class, class number and std_name, None if there is no such student
         """
-        self.cursor.execute('''
-            SELECT sid FROM students WHERE class = ? AND class_number = ? AND std_name = ?
-        ''', (class_name, class_number, std_name))
-        return self.cursor.fetchone()[0]
+        return self.getRosterIndex().lookup(class_name, class_number, std_name)
     
     def findEid(self, event_name):
         """
@@ -73,17 +254,82 @@ class Database:
         ''', (event_name,))
         return self.cursor.fetchone()[0]
     
+    def suggestRosterMatches(self, unmatched, limit=3):
+        """
+        Suggest students for roster lines that did not resolve, e.g. the unmatched list returned by enrollStudents
+        unmatched is a list of (row_index, class, class_number, std_name) rows. Return {row_index: candidates}, where candidates are
+        up to limit (score, sid, class, class_number, std_name) students of the same class, best first, scores ranging from 0 to 1
+        """
+        index = self.getRosterIndex()
+        return {row_index: index.suggest(class_name, class_number, std_name, limit) for row_index, class_name, class_number, std_name in unmatched}
+
+    def _addLookups(self, students):
+        """
+        Add the classes and categories of (class, class_number, std_name, category) rows that are not in their lookup tables yet
+        Unknown category codes are added with the code as their name
+        """
+        classes = {student[0] for student in students}
+        self.cursor.executemany('''
+            INSERT OR IGNORE INTO classes (class_name, form) VALUES (?, ?)
+        ''', [(class_name, classForm(class_name)) for class_name in classes])
+        self.cursor.executemany('''
+            INSERT OR IGNORE INTO categories (code, name) VALUES (?, ?)
+        ''', [(category, CATEGORY_NAMES.get(category, category)) for category in {student[3] for student in students}])
+
     ### INSERT QUERIES ###
 
+    @mutating
     def addStudent(self, class_name, class_number, std_name, category):
         """
         Add a student to the database
         """
+        self._addLookups([(class_name, class_number, std_name, category)])
         self.cursor.execute('''
-            INSERT INTO students (class, class_number, std_name, category) VALUES (?, ?, ?, ?)
+            INSERT INTO students (class_id, class_number, std_name, category_id) VALUES (
+                (SELECT class_id FROM classes WHERE class_name = ?), ?, ?, (SELECT category_id FROM categories WHERE code = ?)
+            )
         ''', (class_name, class_number, std_name, category))
         self.conn.commit()
+        self.rosterIndex.add(self.cursor.lastrowid, class_name, class_number, std_name)
 
+    @mutating
+    def addStudents(self, students):
+        """
+        Add many students to the database in a single transaction
+        students is an iterable of (class, class_number, std_name, category) rows. Every row is validated before anything is written,
+        a ValueError naming the first bad row (1-based) is raised and nothing is inserted if any row is invalid.
+        Return the number of students added
+        """
+        rows = []
+        for index, student in enumerate(students, start=1):
+            if len(student) != 4:
+                raise ValueError(f"Row {index}: expected 4 fields but got {len(student)}")
+            class_name, class_number, std_name, category = (str(item).strip() for item in student)
+            if not class_name or not std_name or not category:
+                raise ValueError(f"Row {index}: class, name and category must not be empty")
+            if not class_number.isdigit():
+                raise ValueError(f"Row {index}: class number '{class_number}' is not a number")
+            rows.append((class_name, int(class_number), std_name, category))
+
+        with self.conn:
+            self.cursor.execute('SELECT COALESCE(MAX(sid), 0) FROM students')
+            lastSid = self.cursor.fetchone()[0]
+            self._addLookups(rows)
+            self.cursor.executemany('''
+                INSERT INTO students (class_id, class_number, std_name, category_id) VALUES (
+                    (SELECT class_id FROM classes WHERE class_name = ?), ?, ?, (SELECT category_id FROM categories WHERE code = ?)
+                )
+            ''', rows)
+        if self.rosterIndex.isLoaded():
+            # sid is AUTOINCREMENT, so the new students are exactly the ones above the previous maximum
+            self.cursor.execute('''
+                SELECT sid, class, class_number, std_name FROM student_details WHERE sid > ?
+            ''', (lastSid,))
+            for row in self.cursor.fetchall():
+                self.rosterIndex.add(*row)
+        return len(rows)
+
+    @mutating
     def addEvent(self, event_name):
         """
         Add an event to the database
@@ -93,6 +339,7 @@ class Database:
         ''', (event_name,))
         self.conn.commit()
     
+    @mutating
     def addRecord(self, sid, eid, status='1'):
         """
         Add a record to the database
@@ -102,6 +349,7 @@ class Database:
         ''', (sid, eid, status))
         self.conn.commit()
 
+    @mutating
     def addEventWithReturn(self, event_name):
         """
         Add an event to the database and return the event id
@@ -112,6 +360,23 @@ class Database:
         self.conn.commit()
         return self.cursor.lastrowid
     
+    @mutating
+    def enrollStudents(self, eid, roster):
+        """
+        Add many students to an event in a single transaction
+        roster is a list of (class, class_number, std_name) rows, resolved to sids through the in-memory roster index.
+        Return the list of (row_index, class, class_number, std_name) rows that match no student, nothing is inserted unless that list is empty
+        """
+        index = self.getRosterIndex()
+        resolved = [index.lookup(*row) for row in roster]
+        unmatched = [(row_index, *roster[row_index]) for row_index, sid in enumerate(resolved) if sid is None]
+        if not unmatched:
+            with self.conn:
+                self.cursor.executemany('''
+                    INSERT INTO records (sid, eid) VALUES (?, ?)
+                ''', [(sid, eid) for sid in resolved])
+        return unmatched
+
     ### GET QUERIES ###
 
     def getTotalNumberOfStudents(self):
@@ -157,11 +422,12 @@ class Database:
         """
         if category == 'all':
             self.cursor.execute('''
-                SELECT COUNT(*) FROM records WHERE eid = ?
+                SELECT COALESCE(SUM(participants), 0) FROM event_category_counts WHERE eid = ?
             ''', (eid,))
         else:
             self.cursor.execute('''
-                SELECT COUNT(*) FROM records WHERE eid = ? AND sid IN (SELECT sid FROM students WHERE category = ?)
+                SELECT COALESCE(SUM(participants), 0) FROM event_category_counts
+                WHERE eid = ? AND category_id = (SELECT category_id FROM categories WHERE code = ?)
             ''', (eid, category))
         return self.cursor.fetchone()[0]
     
@@ -174,14 +440,14 @@ class Database:
             self.cursor.execute('''
                 SELECT COUNT(*), class, class_number, std_name 
                 FROM records 
-                JOIN students ON records.sid = students.sid 
+                JOIN student_details AS students ON records.sid = students.sid 
                 WHERE records.sid = ?
             ''', (sid,))
         else:
             self.cursor.execute('''
                 SELECT COUNT(*), class, class_number, std_name 
                 FROM records 
-                JOIN students ON records.sid = students.sid 
+                JOIN student_details AS students ON records.sid = students.sid 
                 WHERE records.sid = ? AND eid IN (SELECT eid FROM events WHERE category = ?)
             ''', (sid, category))
         result = self.cursor.fetchone()
@@ -197,22 +463,31 @@ class Database:
         Get the number of events each student has participated in along with their class, class number, and name.
         If category is specified, get the number of events for that category, otherwise get the total number of events.
         """
+        return self.fetchAllCached(self.getStudentsEventCountsQuery(category))
+
+    @queryBuilder
+    def getStudentsEventCountsQuery(self, category='all'):
+        """
+        Build the SQL and parameters of getStudentsEventCounts
+        The class names are joined in once per student rather than once per record: all records are counted per sid first,
+        a single category starts from its students and counts their records through the sid index
+        """
         if category == 'all':
-            self.cursor.execute('''
-                SELECT class, class_number, std_name, COUNT(*)
-                FROM records 
-                JOIN students ON records.sid = students.sid 
-                GROUP BY records.sid
-            ''')
+            return ('''
+                SELECT class_name, class_number, std_name, counts.events
+                FROM (SELECT sid, COUNT(*) AS events FROM records GROUP BY sid) AS counts
+                JOIN students ON counts.sid = students.sid
+                JOIN classes ON students.class_id = classes.class_id
+            ''', ())
         else:
-            self.cursor.execute('''
-                SELECT class, class_number, std_name, COUNT(*)
-                FROM records 
-                JOIN students ON records.sid = students.sid 
-                WHERE eid IN (SELECT eid FROM events WHERE category = ?)
-                GROUP BY records.sid
+            return ('''
+                SELECT class_name, class_number, std_name, COUNT(*)
+                FROM students
+                JOIN classes ON students.class_id = classes.class_id
+                JOIN records ON records.sid = students.sid
+                WHERE students.category_id = (SELECT category_id FROM categories WHERE code = ?)
+                GROUP BY students.sid
             ''', (category,))
-        return self.cursor.fetchall()
     
     def getStudentsEventsParticipated(self, category='all'):
         """
@@ -220,24 +495,32 @@ class Database:
         If category is specified, get the list of events for that category, otherwise get the total list of events.
         Events for the same student will be grouped together in the event_name column, separated by commas.
         """
+        return self.fetchAllCached(self.getStudentsEventsParticipatedQuery(category))
+
+    @queryBuilder
+    def getStudentsEventsParticipatedQuery(self, category='all'):
+        """
+        Build the SQL and parameters of getStudentsEventsParticipated
+        """
         if category == 'all':
-            self.cursor.execute('''
-                SELECT class, class_number, std_name, GROUP_CONCAT(event_name, ', ') AS events
+            return ('''
+                SELECT class_name, class_number, std_name, GROUP_CONCAT(event_name, ', ') AS events
                 FROM records 
                 JOIN students ON records.sid = students.sid 
+                JOIN classes ON students.class_id = classes.class_id
                 JOIN events ON records.eid = events.eid
-                GROUP BY class, class_number, std_name
-            ''')
+                GROUP BY students.class_id, class_number, std_name
+            ''', ())
         else:
-            self.cursor.execute('''
-                SELECT class, class_number, std_name, GROUP_CONCAT(event_name, ', ') AS events
+            return ('''
+                SELECT class_name, class_number, std_name, GROUP_CONCAT(event_name, ', ') AS events
                 FROM records 
                 JOIN students ON records.sid = students.sid 
+                JOIN classes ON students.class_id = classes.class_id
                 JOIN events ON records.eid = events.eid 
-                WHERE category = ?
-                GROUP BY class, class_number, std_name
+                WHERE students.category_id = (SELECT category_id FROM categories WHERE code = ?)
+                GROUP BY students.class_id, class_number, std_name
             ''', (category,))
-        return self.cursor.fetchall()
     
     def getStudentEventList(self, sid, category='all'):
         """
@@ -259,53 +542,192 @@ class Database:
         Get the list of events and the number of students participated in each event
         if category is specified, get the list of events for that status, otherwise get the total list of events
         """
+        return self.fetchAllCached(self.getStudentEventTableQuery(category))
+
+    @queryBuilder
+    def getStudentEventTableQuery(self, category='all'):
+        """
+        Build the SQL and parameters of getStudentEventTable
+        The counts come from the trigger-maintained event_category_counts table, so the cost follows the number of events, not records
+        """
         if category == 'all':
-            self.cursor.execute('''
-                SELECT event_name, COUNT(sid) FROM events LEFT JOIN records ON events.eid = records.eid GROUP BY event_name
-            ''')
-        else:
-            self.cursor.execute('''
-                SELECT event_name, COUNT(records.sid) FROM events 
-                LEFT JOIN records ON events.eid = records.eid 
-                LEFT JOIN students ON records.sid = students.sid
-                WHERE category = ? 
+            return ('''
+                SELECT event_name, COALESCE(SUM(counts.participants), 0) FROM events
+                LEFT JOIN event_category_counts AS counts ON events.eid = counts.eid
                 GROUP BY event_name
+            ''', ())
+        else:
+            return ('''
+                SELECT event_name, counts.participants FROM events
+                JOIN event_category_counts AS counts ON events.eid = counts.eid
+                WHERE counts.category_id = (SELECT category_id FROM categories WHERE code = ?) AND counts.participants > 0
+                ORDER BY event_name
             ''', (category,))
-        return self.cursor.fetchall()
     
+    def getEventCategoryCrosstab(self, categories=('C', 'F', 'H', 'D', 'S')):
+        """
+        Get the list of events with the number of participants in each of the given categories, followed by the total over all categories
+        All columns come from one grouped pass, instead of one getStudentEventTable call per category
+        """
+        return self.fetchAllCached(self.getEventCategoryCrosstabQuery(categories))
+
+    @queryBuilder
+    def getEventCategoryCrosstabQuery(self, categories=('C', 'F', 'H', 'D', 'S')):
+        """
+        Build the SQL and parameters of getEventCategoryCrosstab
+        """
+        columns = ''.join(
+            'SUM(CASE WHEN counts.category_id = (SELECT category_id FROM categories WHERE code = ?) THEN counts.participants ELSE 0 END), '
+            for _ in categories
+        )
+        return (f'''
+            SELECT event_name, {columns}COALESCE(SUM(counts.participants), 0)
+            FROM events
+            LEFT JOIN event_category_counts AS counts ON events.eid = counts.eid
+            GROUP BY event_name
+        ''', tuple(categories))
+
     def getEventParticipantWithNames(self, category='all'):
         """
         Get the list of events and the number of students participated in each event along with their names
         if category is specified, get the list of events for that category, otherwise get the total list of events
         """
+        return self.fetchAllCached(self.getEventParticipantWithNamesQuery(category))
+
+    @queryBuilder
+    def getEventParticipantWithNamesQuery(self, category='all'):
+        """
+        Build the SQL and parameters of getEventParticipantWithNames
+        """
         if category == 'all':
-            self.cursor.execute('''
+            return ('''
             SELECT event_name, GROUP_CONCAT(std_name, ', ') AS student_names 
             FROM events 
             LEFT JOIN records ON events.eid = records.eid 
             LEFT JOIN students ON records.sid = students.sid 
             GROUP BY event_name
-            ''')
+            ''', ())
         else:
-            self.cursor.execute('''
+            return ('''
             SELECT event_name, GROUP_CONCAT(std_name, ', ') AS student_names 
             FROM events 
-            LEFT JOIN records ON events.eid = records.eid 
-            LEFT JOIN students ON records.sid = students.sid
-            WHERE category = ? 
+            JOIN records ON events.eid = records.eid 
+            JOIN students ON records.sid = students.sid
+            WHERE students.category_id = (SELECT category_id FROM categories WHERE code = ?)
             GROUP BY event_name
             ''', (category,))
-        return self.cursor.fetchall()
     
+    @queryBuilder
+    def getEventParticipantCountsQuery(self, category='all'):
+        """
+        Build the SQL and parameters of the top level of the event drill-down: (eid, event_name, number of participants) by event name
+        Like getStudentEventTable the counts come from event_category_counts, so the cost follows the number of events
+        """
+        if category == 'all':
+            return ('''
+                SELECT events.eid, event_name, COALESCE(SUM(counts.participants), 0) FROM events
+                LEFT JOIN event_category_counts AS counts ON events.eid = counts.eid
+                GROUP BY events.eid
+                ORDER BY event_name
+            ''', ())
+        else:
+            return ('''
+                SELECT events.eid, event_name, counts.participants FROM events
+                JOIN event_category_counts AS counts ON events.eid = counts.eid
+                WHERE counts.category_id = (SELECT category_id FROM categories WHERE code = ?) AND counts.participants > 0
+                ORDER BY event_name
+            ''', (category,))
+
+    def getEventParticipantsPage(self, eid, category='all', after=0, limit=100):
+        """
+        Get up to limit (rid, class, class_number, std_name) participants of an event in the order they were enrolled
+        Pages are chained by passing the rid of the last row as after, each one is an index seek however many participants the event has
+        """
+        self.cursor.execute(*self.getEventParticipantsPageQuery(eid, category, after, limit))
+        return self.cursor.fetchall()
+
+    @queryBuilder
+    def getEventParticipantsPageQuery(self, eid, category='all', after=0, limit=100):
+        """
+        Build the SQL and parameters of getEventParticipantsPage
+        """
+        if category == 'all':
+            return ('''
+                SELECT records.rid, class_name, class_number, std_name
+                FROM records
+                JOIN students ON records.sid = students.sid
+                JOIN classes ON students.class_id = classes.class_id
+                WHERE records.eid = ? AND records.rid > ?
+                ORDER BY records.rid
+                LIMIT ?
+            ''', (eid, after, limit))
+        else:
+            return ('''
+                SELECT records.rid, class_name, class_number, std_name
+                FROM records
+                JOIN students ON records.sid = students.sid
+                JOIN classes ON students.class_id = classes.class_id
+                WHERE records.eid = ? AND records.rid > ? AND students.category_id = (SELECT category_id FROM categories WHERE code = ?)
+                ORDER BY records.rid
+                LIMIT ?
+            ''', (eid, after, category, limit))
+
+    @queryBuilder
+    def getStudentEventCountsWithIdsQuery(self, category='all'):
+        """
+        Build the SQL and parameters of the top level of the student drill-down: (sid, class, class_number, std_name, number of events)
+        of every student with at least one event, in class order
+        """
+        if category == 'all':
+            return ('''
+                SELECT students.sid, class_name, class_number, std_name, counts.events
+                FROM (SELECT sid, COUNT(*) AS events FROM records GROUP BY sid) AS counts
+                JOIN students ON counts.sid = students.sid
+                JOIN classes ON students.class_id = classes.class_id
+                ORDER BY class_name, class_number, students.sid
+            ''', ())
+        else:
+            return ('''
+                SELECT students.sid, class_name, class_number, std_name, COUNT(*)
+                FROM students
+                JOIN classes ON students.class_id = classes.class_id
+                JOIN records ON records.sid = students.sid
+                WHERE students.category_id = (SELECT category_id FROM categories WHERE code = ?)
+                GROUP BY students.sid
+                ORDER BY class_name, class_number, students.sid
+            ''', (category,))
+
+    def getStudentEventsPage(self, sid, after=0, limit=100):
+        """
+        Get up to limit (rid, event_name) events of a student in the order they were recorded, chained by rid like getEventParticipantsPage
+        """
+        self.cursor.execute(*self.getStudentEventsPageQuery(sid, after, limit))
+        return self.cursor.fetchall()
+
+    @queryBuilder
+    def getStudentEventsPageQuery(self, sid, after=0, limit=100):
+        """
+        Build the SQL and parameters of getStudentEventsPage
+        """
+        return ('''
+            SELECT records.rid, event_name
+            FROM records
+            JOIN events ON records.eid = events.eid
+            WHERE records.sid = ? AND records.rid > ?
+            ORDER BY records.rid
+            LIMIT ?
+        ''', (sid, after, limit))
+
     def getStudentsByForm(self, form):
         """
         Get the list of students given their form
         As example, student with class 1A, 1B, 1C, 1D are all in the same form, as their class start with 1, which represent Form 1
         And student with class 2A, 2B, 2C, 2D are all in the same form, e.t.c. 
+        The form of every class is stored in the classes table, see classForm
         """
         self.cursor.execute('''
-            SELECT * FROM students WHERE class LIKE ?
-        ''', (form + '%',))
+            SELECT sid, class, class_number, std_name, category FROM student_details WHERE form = ?
+        ''', (int(form),))
         return self.cursor.fetchall()
     
     def isEventExists(self, event_name):
@@ -321,40 +743,129 @@ class Database:
         """
         Get all students in the database
         """
+        self.cursor.execute(*self.getAllStudentsQuery())
+        return self.cursor.fetchall()
+
+    @queryBuilder
+    def getAllStudentsQuery(self):
+        """
+        Build the SQL and parameters of getAllStudents, the category is given by its name
+        """
+        return ('''
+            SELECT class, class_number, std_name, category_name FROM student_details
+        ''', ())
+    
+    def searchStudents(self, text, limit=None):
+        """
+        Find students whose name or class contains every whitespace-separated term of text, all of them unless limit is given
+        """
+        self.cursor.execute(*self.searchStudentsQuery(text, limit))
+        return self.cursor.fetchall()
+
+    @queryBuilder
+    def searchStudentsQuery(self, text, limit=None):
+        """
+        Build the SQL and parameters of searchStudents.
+        Terms of three or more characters go through the trigram index students_fts, shorter ones (a class, or two characters of a name)
+        are below the trigram length and are matched with LIKE on the candidates, which the other terms have already narrowed down.
+        """
+        terms = text.split()
+        if not terms:
+            return self.getAllStudentsQuery()
+        useIndex = self.hasStudentSearchIndex()
+        indexed = [term for term in terms if useIndex and len(term) >= 3]
+        conditions = []
+        params = []
+        if indexed:
+            conditions.append('students.sid IN (SELECT rowid FROM students_fts WHERE students_fts MATCH ?)')
+            # Each term is quoted as an FTS5 string so characters like " or - are searched for literally
+            params.append(' AND '.join('"' + term.replace('"', '""') + '"' for term in indexed))
+        for term in terms:
+            if term in indexed:
+                continue
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(students.std_name LIKE ? ESCAPE '\\' OR students.class LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        # The students view pages the rows in as it scrolls, a limit is only for callers that want the first few matches
+        if limit is not None:
+            params.append(limit)
+        return (f'''
+            SELECT class, class_number, std_name, category_name FROM student_details AS students
+            WHERE {' AND '.join(conditions)}
+            ORDER BY class, class_number
+            {'LIMIT ?' if limit is not None else ''}
+        ''', tuple(params))
+
+    def hasStudentSearchIndex(self):
+        """
+        Check if the students_fts index exists, it is missing if this SQLite was built without FTS5
+        """
+        return self.hasTable('students_fts')
+
+    def hasTable(self, table_name):
         self.cursor.execute('''
-            SELECT class, class_number, std_name, category FROM students
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?
+        ''', (table_name,))
+        return self.cursor.fetchone() is not None
+
+    def getAllStudentsWithIds(self):
+        """
+        Get all students in the database, each row led by its sid, the category is given by its name
+        """
+        self.cursor.execute('''
+            SELECT sid, class, class_number, std_name, category_name FROM student_details
         ''')
         return self.cursor.fetchall()
-    
+
     def getAllEvents(self):
         """
         Get all events in the database
         """
-        self.cursor.execute('''
+        self.cursor.execute(*self.getAllEventsQuery())
+        return self.cursor.fetchall()
+
+    @queryBuilder
+    def getAllEventsQuery(self):
+        """
+        Build the SQL and parameters of getAllEvents
+        """
+        return ('''
             SELECT event_name FROM events
+        ''', ())
+
+    def getAllEventsWithIds(self):
+        """
+        Get all events in the database, each row led by its eid
+        """
+        self.cursor.execute('''
+            SELECT eid, event_name FROM events
         ''')
         return self.cursor.fetchall()
     
     ### REMOVE QUARIES ###
 
+    @mutating
     def removeStudent(self, sid):
         """
-        Remove a student from the database
+        Remove a student from the database, their records are deleted with them
         """
         self.cursor.execute('''
             DELETE FROM students WHERE sid = ?
         ''', (sid,))
         self.conn.commit()
+        self.rosterIndex.remove(sid)
 
+    @mutating
     def removeEvent(self, eid):
         """
-        Remove an event from the database
+        Remove an event from the database, its records are deleted with it
         """
         self.cursor.execute('''
             DELETE FROM events WHERE eid = ?
         ''', (eid,))
         self.conn.commit()
 
+    @mutating
     def removeRecord(self, rid):
         """
         Remove a record from the database
@@ -364,6 +875,7 @@ class Database:
         ''', (rid,))
         self.conn.commit()
 
+    @mutating
     def removeRecordByEid(self, eid):
         """
         Remove all records for an event from the database
@@ -373,6 +885,7 @@ class Database:
         ''', (eid,))
         self.conn.commit()
 
+    @mutating
     def removeRecordBySid(self, sid):
         """
         Remove all records for a student from the database
@@ -380,4 +893,673 @@ class Database:
         self.cursor.execute('''
             DELETE FROM records WHERE sid = ?
         ''', (sid,))
-        self.conn.commit()
\ No newline at end of file
+        self.conn.commit()
+
+    @mutating
+    def removeStudents(self, sids):
+        """
+        Remove many students, and their records, in a single transaction
+        Return the number of students removed
+        """
+        sids = list(sids) # Read twice, a generator would leave the roster index holding deleted students
+        with self.conn:
+            self.cursor.executemany('''
+                DELETE FROM students WHERE sid = ?
+            ''', [(sid,) for sid in sids])
+            removed = self.cursor.rowcount
+        for sid in sids:
+            self.rosterIndex.remove(sid)
+        return removed
+
+    @mutating
+    def removeEvents(self, eids):
+        """
+        Remove many events, and their records, in a single transaction
+        Return the number of events removed
+        """
+        eids = list(eids)
+        with self.conn:
+            self.cursor.executemany('''
+                DELETE FROM events WHERE eid = ?
+            ''', [(eid,) for eid in eids])
+            return self.cursor.rowcount
+
+    @mutating
+    def removeRecords(self, rids):
+        """
+        Remove many records in a single transaction
+        Return the number of records removed
+        """
+        rids = list(rids)
+        with self.conn:
+            self.cursor.executemany('''
+                DELETE FROM records WHERE rid = ?
+            ''', [(rid,) for rid in rids])
+            return self.cursor.rowcount
+
+    @mutating
+    def applyChanges(self, changes):
+        """
+        Apply a change set, as built by HistoryContainer.changes(), in a single transaction
+        changes maps (table, action) to a list of primary keys; ('students', 'delete') and ('events', 'delete') are supported,
+        the records of deleted students and events cascade with them. Nothing is written if any change is not supported.
+        Return the number of rows deleted per table
+        """
+        statements = {
+            ('students', 'delete'): 'DELETE FROM students WHERE sid = ?',
+            ('events', 'delete'): 'DELETE FROM events WHERE eid = ?',
+        }
+        for change in changes:
+            if change not in statements:
+                raise ValueError(f"Unsupported change {change}")
+        changes = {change: list(keys) for change, keys in changes.items()}
+        deleted = {}
+        with self.conn:
+            for change, keys in changes.items():
+                self.cursor.executemany(statements[change], [(key,) for key in keys])
+                deleted[change[0]] = self.cursor.rowcount
+        for sid in changes.get(('students', 'delete'), ()):
+            self.rosterIndex.remove(sid)
+        return deleted
+
+    ### ARCHIVES ###
+
+    def getArchives(self):
+        """
+        Get the (year_label, path) of every archived school year, oldest label first
+        Paths of archives next to the database file are stored relative to it and returned resolved
+        """
+        if not self.hasTable('archives'):
+            return []
+        self.cursor.execute('''
+            SELECT year_label, path FROM archives ORDER BY year_label
+        ''')
+        base = Path(self.db_name).resolve().parent
+        return [(year_label, str(base / path)) for year_label, path in self.cursor.fetchall()]
+
+    @mutating
+    def archiveYear(self, year_label, archive_path=None):
+        """
+        Close a school year: copy the whole database into an archive file, then remove every event, and with them every record,
+        from the live database. Students stay, so a student keeps their sid across years and can be followed through the archives.
+        The archive defaults to <database name>_<year_label>.db next to the database. Return the archive path
+        """
+        year_label = str(year_label).strip()
+        if not year_label:
+            raise ValueError("The school year needs a label, e.g. 2024-25")
+        if any(label == year_label for label, _ in self.getArchives()):
+            raise ValueError(f"The school year {year_label} is already archived")
+        live = Path(self.db_name).resolve()
+        archive = Path(archive_path).resolve() if archive_path else live.with_name(f'{live.stem}_{year_label}{live.suffix}')
+        if archive.exists():
+            raise FileExistsError(f"Archive file {archive} already exists")
+
+        # VACUUM INTO writes a compact, consistent copy and cannot run inside a transaction
+        self.conn.commit()
+        self.cursor.execute('VACUUM INTO ?', (str(archive),))
+        archiveConn = sqlite3.connect(archive)
+        try:
+            with archiveConn:
+                archiveConn.execute('''
+                    CREATE TABLE archive_info (year_label TEXT NOT NULL, archived_at TEXT NOT NULL)
+                ''')
+                archiveConn.execute('''
+                    INSERT INTO archive_info (year_label, archived_at) VALUES (?, datetime('now'))
+                ''', (year_label,))
+        finally:
+            archiveConn.close()
+
+        try:
+            stored = archive.relative_to(live.parent)
+        except ValueError:
+            stored = archive
+        with self.conn:
+            # Records cascade with their events, the participation counts follow through their triggers
+            self.cursor.execute('DELETE FROM events')
+            self.cursor.execute('''
+                INSERT INTO archives (year_label, path, archived_at) VALUES (?, ?, datetime('now'))
+            ''', (year_label, str(stored)))
+        # Give the freed pages back so the live file stays small, in WAL mode that only reaches the file at a checkpoint
+        self.cursor.execute('VACUUM')
+        self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return str(archive)
+
+    @contextmanager
+    def attachArchives(self, year_labels=None):
+        """
+        Attach the archives, all or the ones in year_labels, to the connection for the duration of the block
+        Yield a list of (year_label, schema name) pairs, oldest first, to qualify table names with, e.g. f'{schema}.records'
+        """
+        archives = [(label, path) for label, path in self.getArchives() if year_labels is None or label in year_labels]
+        limit = self.conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(archives) > limit:
+            raise ValueError(f"Cannot attach {len(archives)} archives, SQLite allows {limit} at a time")
+        attached = []
+        try:
+            for index, (label, path) in enumerate(archives):
+                if not Path(path).exists():
+                    raise FileNotFoundError(f"Archive of {label} not found at {path}")
+                schema = f'archive_{index}'
+                self.cursor.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+                attached.append((label, schema))
+            yield attached
+        finally:
+            for _, schema in attached:
+                self.cursor.execute(f'DETACH DATABASE {schema}')
+
+    def _studentsSource(self, schema):
+        """
+        Get the table or view of schema that has students with their class and category as text
+        Archives of school years closed before the lookup tables of version 6 keep that text in the students table itself
+        """
+        self.cursor.execute(f'''
+            SELECT 1 FROM {schema}.sqlite_master WHERE type = 'view' AND name = 'student_details'
+        ''')
+        return f'{schema}.student_details' if self.cursor.fetchone() is not None else f'{schema}.students'
+
+    def getStudentParticipationTrend(self, sid, current_label='current'):
+        """
+        Get the (year_label, class, number of events) of a student for every archived year they were in and the current one
+        """
+        with self.attachArchives() as archives:
+            years = [*archives, (current_label, 'main')]
+            self.cursor.execute(' UNION ALL '.join(f'''
+                SELECT ? AS year_label, {order} AS year_order, students.class,
+                    (SELECT COUNT(*) FROM {schema}.records WHERE records.sid = students.sid)
+                FROM {self._studentsSource(schema)} AS students WHERE students.sid = ?
+            ''' for order, (_, schema) in enumerate(years)) + ' ORDER BY year_order',
+                [value for label, _ in years for value in (label, sid)])
+            return [(label, class_name, events) for label, _, class_name, events in self.cursor.fetchall()]
+
+    def getStudentsYearlyCounts(self, current_label='current'):
+        """
+        Get the number of events of every current student in each archived year and the current one
+        Return (year labels, rows), rows are (class, class_number, std_name, count per year...) in class order
+        """
+        with self.attachArchives() as archives:
+            years = [*archives, (current_label, 'main')]
+            counts = ', '.join(f'''
+                (SELECT COUNT(*) FROM {schema}.records WHERE records.sid = students.sid)
+            ''' for _, schema in years)
+            self.cursor.execute(f'''
+                SELECT students.class, students.class_number, students.std_name, {counts}
+                FROM main.student_details AS students
+                ORDER BY students.class, students.class_number
+            ''')
+            return [label for label, _ in years], self.cursor.fetchall()
+
+    ### BACKUP ###
+
+    @mutating
+    def restoreFrom(self, snapshot_path):
+        """
+        Replace the contents of the database with a snapshot, e.g. one taken by BackupThread, through the online backup API
+        The snapshot must pass PRAGMA integrity_check; it is brought up to the current schema after the restore
+        """
+        snapshot = sqlite3.connect(Path(snapshot_path).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            result = snapshot.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f"Snapshot {snapshot_path} is damaged: {result}")
+            self.conn.commit()
+            snapshot.backup(self.conn)
+        finally:
+            snapshot.close()
+        self.rosterIndex.invalidate()
+        self.resultCache.clear()
+        self.migrate()
+
+    ### MIGRATIONS ###
+
+    def getSchemaVersion(self):
+        """
+        Get the schema version stored in PRAGMA user_version
+        """
+        self.cursor.execute('PRAGMA user_version')
+        return self.cursor.fetchone()[0]
+
+    @mutating
+    def migrate(self):
+        """
+        Bring the schema up to date by running every migration newer than PRAGMA user_version.
+        Each migration runs in its own transaction together with the version bump, so a failed step leaves the database at the last good version.
+        """
+        # Migrations may rewrite students, load the roster index again on next use
+        self.rosterIndex.invalidate()
+        version = self.getSchemaVersion()
+        if version >= len(MIGRATIONS):
+            return
+        # Steps may rebuild tables, which must not cascade; foreign_keys cannot change inside a transaction so it is switched here
+        self.cursor.execute('PRAGMA foreign_keys = OFF')
+        try:
+            for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                self.cursor.execute('BEGIN')
+                try:
+                    step(self)
+                    self.cursor.execute(f'PRAGMA user_version = {target}')
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                self.conn.commit()
+            # Rebuilt tables leave their old pages on the freelist, give them back so the file shrinks; in WAL mode only a checkpoint does
+            if self.cursor.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+                self.cursor.execute('VACUUM')
+                self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            applyConnectionProfile(self.conn, self.profile)
+            self.enableForeignKeys()
+
+    def _migrateAddIndexes(self):
+        """
+        Version 1: add the secondary indexes used by lookups and reports.
+        Duplicated event names are merged first so the unique index on event_name can be created.
+        A student enrolled in more than one copy of an event is kept once in the merged event, by their earliest record.
+        """
+        self.cursor.execute('''
+            UPDATE records SET eid = (
+                SELECT MIN(e2.eid) FROM events e1 JOIN events e2 ON e1.event_name = e2.event_name WHERE e1.eid = records.eid
+            )
+            WHERE eid IN (SELECT eid FROM events)
+        ''')
+        self.cursor.execute('''
+            DELETE FROM records
+            WHERE eid IN (SELECT MIN(eid) FROM events GROUP BY event_name HAVING COUNT(*) > 1)
+            AND rid NOT IN (
+                SELECT MIN(rid) FROM records AS kept
+                WHERE kept.eid IN (SELECT MIN(eid) FROM events GROUP BY event_name HAVING COUNT(*) > 1)
+                GROUP BY kept.sid, kept.eid
+            )
+        ''')
+        self.cursor.execute('''
+            DELETE FROM events WHERE eid NOT IN (SELECT MIN(eid) FROM events GROUP BY event_name)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_students_class_number_name ON students (class, class_number, std_name)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_students_category ON students (category)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_eid ON records (eid)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_sid ON records (sid)
+        ''')
+        self.cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_events_event_name ON events (event_name)
+        ''')
+
+    def _migrateAddParticipationCounts(self):
+        """
+        Version 2: add event_category_counts, the number of participants of every event per student category.
+        It is filled from the existing records and kept up to date by triggers on records, students and events.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_category_counts (
+            eid INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            participants INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (eid, category)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            INSERT INTO event_category_counts (eid, category, participants)
+            SELECT records.eid, students.category, COUNT(*)
+            FROM records JOIN students ON records.sid = students.sid
+            GROUP BY records.eid, students.category
+        ''')
+        self._createRecordCountTriggers()
+        # Changing the category of a student moves all of their records to the new category
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_students_update_counts AFTER UPDATE OF category ON students
+            WHEN OLD.category IS NOT NEW.category
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - (
+                    SELECT COUNT(*) FROM records WHERE records.sid = OLD.sid AND records.eid = event_category_counts.eid
+                )
+                WHERE category = OLD.category AND eid IN (SELECT eid FROM records WHERE sid = OLD.sid);
+                INSERT INTO event_category_counts (eid, category, participants)
+                SELECT eid, NEW.category, COUNT(*) FROM records WHERE sid = NEW.sid GROUP BY eid
+                ON CONFLICT (eid, category) DO UPDATE SET participants = participants + excluded.participants;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_students_delete_counts AFTER DELETE ON students
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - (
+                    SELECT COUNT(*) FROM records WHERE records.sid = OLD.sid AND records.eid = event_category_counts.eid
+                )
+                WHERE category = OLD.category AND eid IN (SELECT eid FROM records WHERE sid = OLD.sid);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_events_delete_counts AFTER DELETE ON events
+            BEGIN
+                DELETE FROM event_category_counts WHERE eid = OLD.eid;
+            END
+        ''')
+
+    def _migrateAddStudentSearch(self):
+        """
+        Version 3: add students_fts, a trigram full-text index over student names and classes used by searchStudents.
+        It reads its text from students and is kept in sync by triggers. Builds of SQLite without FTS5 skip it
+        and searchStudents falls back to LIKE.
+        """
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5 (
+                std_name, class, content = 'students', content_rowid = 'sid', tokenize = 'trigram'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            if 'fts5' not in str(e) and 'trigram' not in str(e):
+                raise
+            return
+        self.cursor.execute('''
+            INSERT INTO students_fts (students_fts) VALUES ('rebuild')
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_students_insert_fts AFTER INSERT ON students
+            BEGIN
+                INSERT INTO students_fts (rowid, std_name, class) VALUES (NEW.sid, NEW.std_name, NEW.class);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_students_delete_fts AFTER DELETE ON students
+            BEGIN
+                INSERT INTO students_fts (students_fts, rowid, std_name, class) VALUES ('delete', OLD.sid, OLD.std_name, OLD.class);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_students_update_fts AFTER UPDATE OF std_name, class ON students
+            BEGIN
+                INSERT INTO students_fts (students_fts, rowid, std_name, class) VALUES ('delete', OLD.sid, OLD.std_name, OLD.class);
+                INSERT INTO students_fts (rowid, std_name, class) VALUES (NEW.sid, NEW.std_name, NEW.class);
+            END
+        ''')
+
+    def _migrateCascadeRecords(self):
+        """
+        Version 4: rebuild records with foreign keys that reference the right tables and cascade deletes.
+        Records of students or events that no longer exist are removed first, they inflate every count.
+        The student delete trigger on the counts now runs before the delete, while the cascaded records can still be counted.
+        """
+        self.cursor.execute('''
+            DELETE FROM records WHERE sid NOT IN (SELECT sid FROM students) OR eid NOT IN (SELECT eid FROM events)
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE records_new (
+            rid INTEGER PRIMARY KEY AUTOINCREMENT,
+            sid INTEGER NOT NULL,
+            eid INTEGER NOT NULL,
+            status TEXT DEFAULT '1',
+            FOREIGN KEY (sid) REFERENCES students(sid) ON DELETE CASCADE,
+            FOREIGN KEY (eid) REFERENCES events(eid) ON DELETE CASCADE
+            )
+        ''')
+        self.cursor.execute('''
+            INSERT INTO records_new (rid, sid, eid, status) SELECT rid, sid, eid, status FROM records
+        ''')
+        # Keep handing out rids after the largest one ever used, not just the largest one left
+        self.cursor.execute('''
+            UPDATE sqlite_sequence SET seq = (SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ('records', 'records_new'))
+            WHERE name = 'records_new'
+        ''')
+        # Dropping records takes its indexes and triggers with it. The triggers on students still name records,
+        # the legacy rename does not try to rewrite them, so they point at the new table once it takes the name.
+        self.cursor.execute('DROP TABLE records')
+        self.cursor.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            self.cursor.execute('ALTER TABLE records_new RENAME TO records')
+        finally:
+            self.cursor.execute('PRAGMA legacy_alter_table = OFF')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_eid ON records (eid)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_sid ON records (sid)
+        ''')
+        self._createRecordCountTriggers()
+        # After a delete the cascaded records are gone and the student is too, so neither side could count them
+        self.cursor.execute('DROP TRIGGER IF EXISTS trg_students_delete_counts')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_students_delete_counts BEFORE DELETE ON students
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - (
+                    SELECT COUNT(*) FROM records WHERE records.sid = OLD.sid AND records.eid = event_category_counts.eid
+                )
+                WHERE category = OLD.category AND eid IN (SELECT eid FROM records WHERE sid = OLD.sid);
+            END
+        ''')
+        if self.cursor.execute('PRAGMA foreign_key_check').fetchone() is not None:
+            raise sqlite3.IntegrityError("records still has rows violating a foreign key")
+
+    def _migrateAddArchives(self):
+        """
+        Version 5: add archives, the school years moved out by archiveYear and the files holding them
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archives (
+            year_label TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+            )
+        ''')
+
+    def _migrateNormalizeClassesAndCategories(self):
+        """
+        Version 6: move the class and category text of students into the lookup tables classes, which also holds the form
+        of every class, and categories, and rebuild students and event_category_counts around their integer keys.
+        The student_details view joins the text back in, it is what reports and students_fts read students through.
+        """
+        self.cursor.execute('''
+            CREATE TABLE classes (
+            class_id INTEGER PRIMARY KEY,
+            class_name TEXT NOT NULL UNIQUE,
+            form INTEGER
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE categories (
+            category_id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL
+            )
+        ''')
+        self.cursor.executemany('''
+            INSERT INTO categories (code, name) VALUES (?, ?)
+        ''', [(code, name) for code, name in CATEGORY_NAMES.items() if code != 'all'])
+        self.cursor.execute('SELECT DISTINCT class, 0, \'\', category FROM students')
+        self._addLookups(self.cursor.fetchall())
+        self.cursor.execute('''
+            CREATE INDEX idx_classes_form ON classes (form)
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE students_new (
+            sid INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_id INTEGER NOT NULL REFERENCES classes(class_id),
+            class_number INTEGER NOT NULL,
+            std_name TEXT NOT NULL,
+            category_id INTEGER NOT NULL REFERENCES categories(category_id)
+            )
+        ''')
+        self.cursor.execute('''
+            INSERT INTO students_new (sid, class_id, class_number, std_name, category_id)
+            SELECT students.sid, classes.class_id, students.class_number, students.std_name, categories.category_id
+            FROM students
+            JOIN classes ON classes.class_name = students.class
+            JOIN categories ON categories.code = students.category
+        ''')
+        self.cursor.execute('''
+            UPDATE sqlite_sequence SET seq = (SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ('students', 'students_new'))
+            WHERE name = 'students_new'
+        ''')
+        # The index reads the text columns through its content table, it is rebuilt over student_details below
+        hasSearchIndex = self.hasStudentSearchIndex()
+        self.cursor.execute('DROP TABLE IF EXISTS students_fts')
+        # Dropping students takes its indexes and triggers with it, the foreign keys of records name students and follow the rename
+        self.cursor.execute('DROP TABLE students')
+        self.cursor.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            self.cursor.execute('ALTER TABLE students_new RENAME TO students')
+        finally:
+            self.cursor.execute('PRAGMA legacy_alter_table = OFF')
+        self.cursor.execute('''
+            CREATE INDEX idx_students_class_number_name ON students (class_id, class_number, std_name)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX idx_students_category ON students (category_id)
+        ''')
+        self.cursor.execute('''
+            CREATE VIEW student_details AS
+            SELECT students.sid, students.class_id, classes.class_name AS class, classes.form, students.class_number, students.std_name,
+                students.category_id, categories.code AS category, categories.name AS category_name
+            FROM students
+            JOIN classes ON classes.class_id = students.class_id
+            JOIN categories ON categories.category_id = students.category_id
+        ''')
+
+        # The counts are recounted per category_id, the triggers on records are replaced along with the table
+        for trigger in ('trg_records_insert_counts', 'trg_records_delete_counts', 'trg_records_update_counts'):
+            self.cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        self.cursor.execute('DROP TABLE event_category_counts')
+        self.cursor.execute('''
+            CREATE TABLE event_category_counts (
+            eid INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            participants INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (eid, category_id)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            INSERT INTO event_category_counts (eid, category_id, participants)
+            SELECT records.eid, students.category_id, COUNT(*)
+            FROM records JOIN students ON records.sid = students.sid
+            GROUP BY records.eid, students.category_id
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_records_insert_counts AFTER INSERT ON records
+            BEGIN
+                INSERT INTO event_category_counts (eid, category_id, participants)
+                SELECT NEW.eid, category_id, 1 FROM students WHERE sid = NEW.sid
+                ON CONFLICT (eid, category_id) DO UPDATE SET participants = participants + 1;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_records_delete_counts AFTER DELETE ON records
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - 1
+                WHERE eid = OLD.eid AND category_id = (SELECT category_id FROM students WHERE sid = OLD.sid);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_records_update_counts AFTER UPDATE OF sid, eid ON records
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - 1
+                WHERE eid = OLD.eid AND category_id = (SELECT category_id FROM students WHERE sid = OLD.sid);
+                INSERT INTO event_category_counts (eid, category_id, participants)
+                SELECT NEW.eid, category_id, 1 FROM students WHERE sid = NEW.sid
+                ON CONFLICT (eid, category_id) DO UPDATE SET participants = participants + 1;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_students_update_counts AFTER UPDATE OF category_id ON students
+            WHEN OLD.category_id IS NOT NEW.category_id
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - (
+                    SELECT COUNT(*) FROM records WHERE records.sid = OLD.sid AND records.eid = event_category_counts.eid
+                )
+                WHERE category_id = OLD.category_id AND eid IN (SELECT eid FROM records WHERE sid = OLD.sid);
+                INSERT INTO event_category_counts (eid, category_id, participants)
+                SELECT eid, NEW.category_id, COUNT(*) FROM records WHERE sid = NEW.sid GROUP BY eid
+                ON CONFLICT (eid, category_id) DO UPDATE SET participants = participants + excluded.participants;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER trg_students_delete_counts BEFORE DELETE ON students
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - (
+                    SELECT COUNT(*) FROM records WHERE records.sid = OLD.sid AND records.eid = event_category_counts.eid
+                )
+                WHERE category_id = OLD.category_id AND eid IN (SELECT eid FROM records WHERE sid = OLD.sid);
+            END
+        ''')
+
+        if hasSearchIndex:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE students_fts USING fts5 (
+                std_name, class, content = 'student_details', content_rowid = 'sid', tokenize = 'trigram'
+                )
+            ''')
+            self.cursor.execute('''
+                INSERT INTO students_fts (students_fts) VALUES ('rebuild')
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER trg_students_insert_fts AFTER INSERT ON students
+                BEGIN
+                    INSERT INTO students_fts (rowid, std_name, class)
+                    VALUES (NEW.sid, NEW.std_name, (SELECT class_name FROM classes WHERE class_id = NEW.class_id));
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER trg_students_delete_fts AFTER DELETE ON students
+                BEGIN
+                    INSERT INTO students_fts (students_fts, rowid, std_name, class)
+                    VALUES ('delete', OLD.sid, OLD.std_name, (SELECT class_name FROM classes WHERE class_id = OLD.class_id));
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER trg_students_update_fts AFTER UPDATE OF std_name, class_id ON students
+                BEGIN
+                    INSERT INTO students_fts (students_fts, rowid, std_name, class)
+                    VALUES ('delete', OLD.sid, OLD.std_name, (SELECT class_name FROM classes WHERE class_id = OLD.class_id));
+                    INSERT INTO students_fts (rowid, std_name, class)
+                    VALUES (NEW.sid, NEW.std_name, (SELECT class_name FROM classes WHERE class_id = NEW.class_id));
+                END
+            ''')
+        if self.cursor.execute('PRAGMA foreign_key_check').fetchone() is not None:
+            raise sqlite3.IntegrityError("students or records still have rows violating a foreign key")
+
+    def _createRecordCountTriggers(self):
+        """
+        Create the triggers on records that keep event_category_counts up to date, as keyed by category text up to version 5
+        """
+        # A record counts towards the category of its student, records of missing students are not counted
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_records_insert_counts AFTER INSERT ON records
+            BEGIN
+                INSERT INTO event_category_counts (eid, category, participants)
+                SELECT NEW.eid, category, 1 FROM students WHERE sid = NEW.sid
+                ON CONFLICT (eid, category) DO UPDATE SET participants = participants + 1;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_records_delete_counts AFTER DELETE ON records
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - 1
+                WHERE eid = OLD.eid AND category = (SELECT category FROM students WHERE sid = OLD.sid);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_records_update_counts AFTER UPDATE OF sid, eid ON records
+            BEGIN
+                UPDATE event_category_counts SET participants = participants - 1
+                WHERE eid = OLD.eid AND category = (SELECT category FROM students WHERE sid = OLD.sid);
+                INSERT INTO event_category_counts (eid, category, participants)
+                SELECT NEW.eid, category, 1 FROM students WHERE sid = NEW.sid
+                ON CONFLICT (eid, category) DO UPDATE SET participants = participants + 1;
+            END
+        ''')
+
+
+# Ordered schema migrations, the database is at version N once MIGRATIONS[N - 1] has run.
+# Append new steps to the end, never reorder or remove existing ones.
+MIGRATIONS = [
+    Database._migrateAddIndexes,
+    Database._migrateAddParticipationCounts,
+    Database._migrateAddStudentSearch,
+    Database._migrateCascadeRecords,
+    Database._migrateAddArchives,
+    Database._migrateNormalizeClassesAndCategories,
+]
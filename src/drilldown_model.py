@@ -0,0 +1,104 @@
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt
+from src.formatting import formatValue
+
+class DrillDownModel(QAbstractItemModel):
+    """
+    A read-only two-level tree model: group rows, e.g. events with their number of participants, each expanding into its members.
+    A group row is (key, value, ...) and a member row is (cursor, value, ...), the key and cursor are not shown.
+    Members are only loaded once their group is expanded, a page at a time through fetchPage(key, after, limit), where after is
+    the cursor of the last member loaded, 0 for the first page. The view asks for the next page as it scrolls to the end of a group.
+    count_column is the column of the group rows holding their number of members, member values are shown from member_column on.
+    """
+    PAGE_SIZE = 100
+    GROUP = 0 # internalId of group indexes, member indexes hold the row of their group plus one
+
+    def __init__(self, horizontal_header, groups, fetchPage, count_column, member_column=0, parent=None):
+        super().__init__(parent)
+        self._header = list(horizontal_header)
+        self._groups = [tuple(group) for group in groups]
+        self._fetchPage = fetchPage
+        self._countColumn = count_column
+        self._memberColumn = member_column
+        self._members : dict[int, list[tuple]] = {}
+        self._exhausted : set[int] = set()
+
+    def _isGroup(self, index):
+        return index.isValid() and index.internalId() == self.GROUP
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not parent.isValid():
+            if 0 <= row < len(self._groups) and 0 <= column < len(self._header):
+                return self.createIndex(row, column, self.GROUP)
+        elif self._isGroup(parent):
+            if 0 <= row < len(self._members.get(parent.row(), ())) and 0 <= column < len(self._header):
+                return self.createIndex(row, column, parent.row() + 1)
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == self.GROUP:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, self.GROUP)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self._groups)
+        if self._isGroup(parent):
+            return len(self._members.get(parent.row(), ()))
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self._header)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self._groups)
+        return self._isGroup(parent) and bool(self.memberCount(parent.row()))
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return self._isGroup(parent) and bool(self.memberCount(parent.row())) and parent.row() not in self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        group = parent.row()
+        members = self._members.setdefault(group, [])
+        page = self._fetchPage(self._groups[group][0], members[-1][0] if members else 0, self.PAGE_SIZE)
+        if len(page) < self.PAGE_SIZE:
+            self._exhausted.add(group)
+        if page:
+            self.beginInsertRows(self.index(group, 0), len(members), len(members) + len(page) - 1)
+            members.extend(tuple(member) for member in page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        if index.internalId() == self.GROUP:
+            values = self._groups[index.row()][1:]
+            column = index.column()
+        else:
+            values = self._members[index.internalId() - 1][index.row()][1:]
+            column = index.column() - self._memberColumn
+        if not 0 <= column < len(values):
+            return None
+        return formatValue(values[column])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self._header[section] if section < len(self._header) else None
+
+    def headers(self):
+        return list(self._header)
+
+    def memberCount(self, group):
+        """
+        Get the number of members of a group as given by its count column, loaded or not
+        """
+        return self._groups[group][1 + self._countColumn] or 0
+
+    def loadedMembers(self, group):
+        """
+        Get the raw member rows of a group loaded so far
+        """
+        return list(self._members.get(group, ()))
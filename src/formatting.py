@@ -0,0 +1,17 @@
+# Display names of the student category codes, 'all' stands for every category in report filters
+CATEGORY_NAMES = {'C':'綜援', 'F':'全免', 'H':'半免', 'D':'經濟困難', 'S':'特殊', 'all':'所有'}
+
+def formatValue(value, formatter=None):
+    """
+    Convert a raw query value to display text, optionally through a column formatter
+    """
+    if formatter is not None:
+        return formatter(value)
+    return '' if value is None else str(value)
+
+def formatRow(row, formatters=None):
+    """
+    Convert a raw query row to display text, formatters maps a column index to its formatter
+    """
+    formatters = formatters or {}
+    return [formatValue(value, formatters.get(column)) for column, value in enumerate(row)]
@@ -0,0 +1,202 @@
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Frames of these functions are plumbing, the statement is attributed to the method that called them
+HELPER_FUNCTIONS = {'fetchAllCached', 'wrapper', 'execute', 'executemany', 'fetchone', 'fetchall', 'fetchmany'}
+
+class QueryInstrumentation:
+    """
+    Collects per-statement timings of a Database and aggregates them per calling method.
+    Statements run outside the Database methods, e.g. reports on the query threads, are attributed to the *Query method that built them.
+    Statements slower than slow_ms are written, with their EXPLAIN QUERY PLAN, to a rotating slow-query log if log_path is given.
+    Connections of several threads may report to the same instance.
+    """
+    def __init__(self, owner_file, slow_ms=100, log_path=None, max_bytes=1024 * 1024, backup_count=3):
+        self.ownerFile = owner_file
+        self.slowMs = slow_ms
+        self.stats : dict[str, dict] = {}
+        self.queryNames : dict[str, str] = {} # SQL text -> name of the *Query method that built it
+        self._lock = threading.Lock()
+        self.logger = None
+        if log_path:
+            self.logger = logging.getLogger(f'lkm.slow_queries.{log_path}')
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            if not self.logger.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self.logger.addHandler(handler)
+
+    def nameQuery(self, sql, name):
+        """
+        Attribute statements running sql, or wrapping it like SELECT COUNT(*) FROM (sql), to name
+        """
+        self.queryNames[sql] = name
+
+    def queryName(self, sql):
+        name = self.queryNames.get(sql)
+        if name is None:
+            name = next((name for known, name in list(self.queryNames.items()) if known in sql), None)
+        return name
+
+    def callingMethod(self, sql=None):
+        """
+        Find the Database method that issued the statement being run, or else the *Query method that built its sql
+        """
+        frame = sys._getframe(2)
+        outside = None
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name not in HELPER_FUNCTIONS:
+                if code.co_filename == self.ownerFile:
+                    return code.co_name
+                if outside is None and code.co_filename != __file__:
+                    outside = code.co_name
+            frame = frame.f_back
+        return (sql and self.queryName(sql)) or outside or '<unknown>'
+
+    def record(self, conn, method, sql, params, elapsed_ms, rows, many=False):
+        with self._lock:
+            entry = self.stats.setdefault(method, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'slow': 0})
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += rows
+            if elapsed_ms < self.slowMs:
+                return
+            entry['slow'] += 1
+        if self.logger is None:
+            return
+        plan = []
+        # executemany has no single parameter set to explain with
+        if not many:
+            try:
+                # A plain cursor, the plan of an instrumented connection must not be timed and explained in turn
+                plan = [row[-1] for row in conn.cursor().execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+            except sqlite3.Error as e:
+                plan = [f'(no plan: {e})']
+        self.logger.info(
+            '%s %.1f ms, %d rows\n  %s\n  params=%r\n  plan: %s',
+            method, elapsed_ms, rows, ' '.join(sql.split()), params, ' | '.join(plan) or '-'
+        )
+
+    def getStats(self):
+        """
+        Get the aggregated stats per method, slowest total first, with the average time per call
+        """
+        with self._lock:
+            entries = [(method, dict(entry)) for method, entry in self.stats.items()]
+        stats = {}
+        for method, entry in sorted(entries, key=lambda item: item[1]['total_ms'], reverse=True):
+            stats[method] = {
+                **entry,
+                'total_ms': round(entry['total_ms'], 3),
+                'max_ms': round(entry['max_ms'], 3),
+                'avg_ms': round(entry['total_ms'] / entry['calls'], 3),
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that times every statement, including the fetches that follow it, and reports it to a QueryInstrumentation.
+    SQLite produces rows lazily, so a statement is only complete once its rows are fetched; it is recorded once a fetch or iteration
+    runs out of rows, or when the next statement starts, the cursor is closed or dropped, or finish() is called.
+    """
+    instrumentation : QueryInstrumentation = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = None
+
+    def execute(self, sql, params=()):
+        self.finish()
+        method = self.instrumentation.callingMethod(sql)
+        start = time.perf_counter()
+        super().execute(sql, params)
+        self._pending = [method, sql, params, (time.perf_counter() - start) * 1000, 0]
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.finish()
+        method = self.instrumentation.callingMethod(sql)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.instrumentation.record(self.connection, method, sql, (), elapsed, max(self.rowcount, 0), many=True)
+        return self
+
+    def _timedFetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending[3] += (time.perf_counter() - start) * 1000
+            if isinstance(result, list):
+                self._pending[4] += len(result)
+            elif result is not None:
+                self._pending[4] += 1
+        return result
+
+    def fetchone(self):
+        row = self._timedFetch(super().fetchone)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timedFetch(super().fetchmany, size)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timedFetch(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+
+    def fetchall(self):
+        result = self._timedFetch(super().fetchall)
+        self.finish()
+        return result
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        self.finish()
+
+    def finish(self):
+        """
+        Record the statement in progress, if any
+        """
+        if self._pending is not None:
+            method, sql, params, elapsed, rows = self._pending
+            self._pending = None
+            if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                rows = max(self.rowcount, rows)
+            self.instrumentation.record(self.connection, method, sql, params, elapsed, rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    A connection whose execute runs on an InstrumentedCursor reporting to instrumentation, once that is set.
+    Read connections are opened with it so the statements run by QueryExecutor and CSVExportThread are timed too.
+    """
+    instrumentation : QueryInstrumentation = None
+
+    def execute(self, sql, params=()):
+        if self.instrumentation is None:
+            return super().execute(sql, params)
+        cursor = self.cursor(InstrumentedCursor)
+        cursor.instrumentation = self.instrumentation
+        return cursor.execute(sql, params)
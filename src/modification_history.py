@@ -1,21 +1,61 @@
 class HistoryContainer:
     """
-    A class to manage a history of modifications.
-    It allows adding entries, retrieving the history, and clearing it.
-
-    More function with be added when needed.
+    A change set of modifications with undo and redo.
+    Entries are kept in the order they were made; undone entries move to a redo stack until a new entry is added.
+    changes() collapses the entries into the primary keys to apply per table and action, so the set can be written in one go.
     """
     def __init__(self):
-        self.history = []
+        self.history : list[History] = []
+        self.redoStack : list[History] = []
 
     def addHistory(self, entry):
         self.history.append(entry)
+        self.redoStack.clear()
 
     def getHistory(self):
         return self.history
 
+    def canUndo(self):
+        return bool(self.history)
+
+    def canRedo(self):
+        return bool(self.redoStack)
+
+    def undo(self):
+        """
+        Take back the latest entry and return it, None if there is nothing to undo
+        """
+        if not self.history:
+            return None
+        entry = self.history.pop()
+        self.redoStack.append(entry)
+        return entry
+
+    def redo(self):
+        """
+        Make the latest undone entry again and return it, None if there is nothing to redo
+        """
+        if not self.redoStack:
+            return None
+        entry = self.redoStack.pop()
+        self.history.append(entry)
+        return entry
+
+    def changes(self):
+        """
+        Get {(table, action): [key, ...]} of the entries in effect, each key once and in the order it was first changed
+        """
+        changes = {}
+        for entry in self.history:
+            changes.setdefault((entry.table, entry.action), {})[entry.key] = None
+        return {change: list(keys) for change, keys in changes.items()}
+
     def clearHistory(self):
         self.history.clear()
+        self.redoStack.clear()
+
+    def __len__(self):
+        return len(self.history)
 
     def __str__(self):
         string = "History:\n"
@@ -25,17 +65,20 @@ class HistoryContainer:
 
 class History:
     """
-    A class to store modification details.
-    By default, it is best paired with table like data structures, but other structure should work well.
-
+    A single modification of a table row, identified by the row's primary key.
+    row holds the raw values of the row and position where it was shown, so an undo can put it back.
     """
-    def __init__(self, **kwargs):
-        self.data = {}
-        for key, value in kwargs.items():
-            self.data[key] = value
+    __slots__ = ('action', 'table', 'key', 'row', 'position')
+
+    def __init__(self, action, table, key, row=(), position=None):
+        self.action = action
+        self.table = table
+        self.key = key
+        self.row = tuple(row)
+        self.position = position
 
     def __getitem__(self, key):
-        return self.data[key]
+        return getattr(self, key)
 
     def __str__(self):
-        return str(self.data)
\ No newline at end of file
+        return str({name: getattr(self, name) for name in self.__slots__})
@@ -1,23 +1,84 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 class Announcer:
     """
     A class that manages observers and notifies them of events.
     A key element of the Observer pattern.
+
+    Observers may subscribe to a subset of event types (topics). Events sent inside batch() are coalesced,
+    so an event type notified many times is delivered once, with the arguments of its last notification.
+    If debounce_ms is given, events are also coalesced on the Qt event loop and delivered once it has been idle for that long.
     """
-    def __init__(self):
-        self._observers : list[Observer] = []
+    def __init__(self, debounce_ms=None):
+        self._observers : dict[Observer, frozenset | None] = {}
+        self._pending : dict[str, tuple] = {}
+        self._batchDepth = 0
+        self._debounceMs = debounce_ms
+        self._timer = None
 
     def notify(self, event_type, *args, **kwargs):
-        for observer in self._observers:
-            observer.notifyUpdate(event_type, *args, **kwargs)
-    
-    def register(self, observer):
-        if observer not in self._observers:
-            self._observers.append(observer)
+        if self._batchDepth == 0 and self._debounceMs is None:
+            self._deliver(event_type, args, kwargs)
+            return
+        # Updating an existing key keeps its position, so events are delivered in the order they were first notified
+        self._pending[event_type] = (args, kwargs)
+        if self._batchDepth == 0:
+            self._schedule()
+
+    @contextmanager
+    def batch(self):
+        """
+        Hold back every notification sent inside the block and deliver each event type once when the outermost batch ends.
+        """
+        self._batchDepth += 1
+        try:
+            yield self
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0:
+                if self._debounceMs is None:
+                    self.flush()
+                else:
+                    self._schedule()
+
+    def flush(self):
+        """
+        Deliver every pending event now.
+        """
+        if self._timer is not None:
+            self._timer.stop()
+        pending, self._pending = self._pending, {}
+        for event_type, (args, kwargs) in pending.items():
+            self._deliver(event_type, args, kwargs)
+
+    def register(self, observer, topics=None):
+        """
+        Register an observer for the given event types, or for every event type if topics is None.
+        Registering an observer again replaces its topics.
+        """
+        self._observers[observer] = None if topics is None else frozenset(topics)
 
     def unregister(self, observer):
-        if observer in self._observers:
-            self._observers.remove(observer)
+        self._observers.pop(observer, None)
+
+    def _deliver(self, event_type, args, kwargs):
+        for observer, topics in list(self._observers.items()):
+            if topics is None or event_type in topics:
+                observer.notifyUpdate(event_type, *args, **kwargs)
+
+    def _schedule(self):
+        if self._timer is None:
+            # Imported here so the announcer stays usable without Qt when debouncing is off
+            from PySide6.QtCore import QTimer
+            self._timer = QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._onTimeout)
+        self._timer.start(self._debounceMs)
+
+    def _onTimeout(self):
+        # A batch still open (e.g. across a nested event loop) will reschedule delivery when it ends
+        if self._batchDepth == 0:
+            self.flush()
 
 
 class Observer(ABC):
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+class QueryTaskSignals(QObject):
+    """
+    Signals of a QueryTask, delivered in the thread that submitted the query.
+    """
+    finished = Signal(object) # the list of result rows
+    failed = Signal(str)
+    cancelled = Signal()
+
+class QueryTask(QRunnable):
+    """
+    A single (sql, params) query run on a pooled thread.
+    Exactly one of finished, failed or cancelled is emitted for every task.
+    """
+    def __init__(self, executor, query):
+        super().__init__()
+        self.signals = QueryTaskSignals()
+        self._executor = executor
+        self._query = query
+        self._cancelled = False
+        self._conn = None
+        # Guards _conn, the thread's connection is reused by the next task and must never be interrupted on its behalf
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """
+        Stop the query, interrupting SQLite if it is already running
+        """
+        with self._lock:
+            self._cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def run(self):
+        with self._lock:
+            if self._cancelled:
+                self.signals.cancelled.emit()
+                return
+            self._conn = self._executor.connection()
+        try:
+            rows = self._conn.execute(*self._query).fetchall()
+        except sqlite3.Error as e:
+            if self._cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(str(e))
+        else:
+            if self._cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(rows)
+        finally:
+            with self._lock:
+                self._conn = None
+
+class QueryExecutor:
+    """
+    Runs report queries off the GUI thread on a QThreadPool.
+    Every pool thread opens its own connection through connect the first time it runs a query and keeps it for later queries.
+    """
+    def __init__(self, connect, max_threads=2):
+        self._connect = connect
+        self._local = threading.local()
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(max_threads)
+        # Threads never expire, so their connections live as long as the executor
+        self._pool.setExpiryTimeout(-1)
+
+    def connection(self):
+        """
+        Get the connection of the calling pool thread, opening it on first use
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def submit(self, query, finished=None, failed=None, cancelled=None):
+        """
+        Queue a (sql, params) query and return its QueryTask
+        The given slots are connected to task.signals before the task is queued, so a fast query cannot finish unheard
+        """
+        task = QueryTask(self, query)
+        task.setAutoDelete(False)
+        for signal, slot in ((task.signals.finished, finished), (task.signals.failed, failed), (task.signals.cancelled, cancelled)):
+            if slot is not None:
+                signal.connect(slot)
+        self._pool.start(task)
+        return task
+
+    def cancel(self, task):
+        """
+        Cancel a submitted task, whether it is still queued or already running
+        """
+        if self._pool.tryTake(task):
+            task.signals.cancelled.emit()
+        else:
+            task.cancel()
+
+    def waitForDone(self, msecs=-1):
+        return self._pool.waitForDone(msecs)
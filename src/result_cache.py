@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    A bounded LRU cache of query results tagged with the write generation they were read at.
+    An entry is only returned while the generation it was stored with is still the current one,
+    so a write anywhere in the database invalidates every entry without having to track which tables it touched.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._entries : OrderedDict[object, tuple] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        """
+        Get the cached value of key, or None if it is missing or was stored at another generation
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != generation:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, generation, value):
+        self._entries[key] = (generation, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,145 @@
+import unicodedata
+
+def rosterKey(class_name, class_number, std_name):
+    """
+    Normalize a (class, class_number, std_name) roster line the way the students table stores it
+    """
+    class_number = str(class_number).strip()
+    return (str(class_name).strip(), int(class_number) if class_number.isdigit() else class_number, str(std_name).strip())
+
+def fuzzyClass(class_name):
+    """
+    Fold full-width characters and case, so '１ａ' and '1A' name the same class when matching fuzzily
+    """
+    return unicodedata.normalize('NFKC', str(class_name)).strip().upper()
+
+def nameTrigrams(std_name):
+    """
+    Get the character trigrams of a name padded with two spaces in front and one behind, like pg_trgm does.
+    The padding gives short (two or three character) Chinese names enough trigrams to match on, e.g. the leading '  陳' survives swapped given-name characters.
+    """
+    padded = '  ' + unicodedata.normalize('NFKC', str(std_name)).replace(' ', '') + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def nameSimilarity(a, b):
+    """
+    Score two names from 0 to 1, half trigram overlap (order and typos) and half shared characters (swapped characters)
+    """
+    trigramsA, trigramsB = nameTrigrams(a), nameTrigrams(b)
+    trigramScore = len(trigramsA & trigramsB) / len(trigramsA | trigramsB)
+    charsA, charsB = list(str(a).strip()), list(str(b).strip())
+    common = sum(min(charsA.count(char), charsB.count(char)) for char in set(charsA))
+    charScore = 2 * common / (len(charsA) + len(charsB)) if charsA or charsB else 0
+    return (trigramScore + charScore) / 2
+
+class RosterIndex:
+    """
+    An in-memory map from (class, class_number, std_name) to sid, with a secondary map from (class, class_number) to the students there.
+    It is loaded from the student_details view on first use and then kept up to date by add() and remove(); a commit by another connection,
+    seen as a change of PRAGMA data_version, or a call to invalidate() makes the next use load it again.
+    Like the database lookups it replaces, a name shared by several students in the same seat resolves to the lowest sid.
+    A third map, from class to name trigram to sids, backs suggest(), the fuzzy matching of lines that lookup() cannot resolve.
+    """
+    def __init__(self):
+        self._byKey : dict[tuple, int] = None
+        self._byClassNumber : dict[tuple, dict[int, str]] = {}
+        self._bySid : dict[int, tuple] = {}
+        self._trigramsByClass : dict[str, dict[str, set[int]]] = {}
+        self._dataVersion = None
+
+    def isLoaded(self):
+        return self._byKey is not None
+
+    def invalidate(self):
+        self._byKey = None
+        self._byClassNumber = {}
+        self._bySid = {}
+        self._trigramsByClass = {}
+        self._dataVersion = None
+
+    def ensureLoaded(self, conn):
+        """
+        Load the index from conn unless it is loaded and no other connection has written since
+        """
+        dataVersion = conn.execute('PRAGMA data_version').fetchone()[0]
+        if self.isLoaded() and dataVersion == self._dataVersion:
+            return self
+        self.invalidate()
+        self._byKey = {}
+        for sid, class_name, class_number, std_name in conn.execute('''
+            SELECT sid, class, class_number, std_name FROM student_details ORDER BY sid
+        '''):
+            self.add(sid, class_name, class_number, std_name)
+        self._dataVersion = dataVersion
+        return self
+
+    def add(self, sid, class_name, class_number, std_name):
+        if not self.isLoaded():
+            return
+        key = rosterKey(class_name, class_number, std_name)
+        self._bySid[sid] = key
+        self._byClassNumber.setdefault(key[:2], {})[sid] = key[2]
+        if sid < self._byKey.get(key, sid + 1):
+            self._byKey[key] = sid
+        trigrams = self._trigramsByClass.setdefault(fuzzyClass(key[0]), {})
+        for trigram in nameTrigrams(key[2]):
+            trigrams.setdefault(trigram, set()).add(sid)
+
+    def remove(self, sid):
+        if not self.isLoaded() or sid not in self._bySid:
+            return
+        key = self._bySid.pop(sid)
+        seat = self._byClassNumber[key[:2]]
+        del seat[sid]
+        if not seat:
+            del self._byClassNumber[key[:2]]
+        if self._byKey.get(key) == sid:
+            # Fall back to the next student with the same name in that seat, if any
+            others = [other for other, name in seat.items() if name == key[2]]
+            if others:
+                self._byKey[key] = min(others)
+            else:
+                del self._byKey[key]
+        trigrams = self._trigramsByClass[fuzzyClass(key[0])]
+        for trigram in nameTrigrams(key[2]):
+            trigrams[trigram].discard(sid)
+            if not trigrams[trigram]:
+                del trigrams[trigram]
+
+    def lookup(self, class_name, class_number, std_name):
+        """
+        Get the sid of a roster line, None if no student matches
+        """
+        return self._byKey.get(rosterKey(class_name, class_number, std_name))
+
+    def studentsAt(self, class_name, class_number):
+        """
+        Get the {sid: std_name} of the students with the given class and class number
+        """
+        return dict(self._byClassNumber.get(rosterKey(class_name, class_number, '')[:2], {}))
+
+    def suggest(self, class_name, class_number, std_name, limit=3):
+        """
+        Get up to limit (score, sid, class, class_number, std_name) candidates for a roster line, best first.
+        Only students of the same class are considered: the ones sharing a name trigram, and the one in the given seat,
+        which catches names too mistyped to share any trigram. A matching class number adds to the score.
+        """
+        trigrams = self._trigramsByClass.get(fuzzyClass(class_name), {})
+        candidates = set()
+        for trigram in nameTrigrams(std_name):
+            candidates |= trigrams.get(trigram, set())
+        seat = rosterKey(class_name, unicodedata.normalize('NFKC', str(class_number)), '')[1]
+        # The leading trigram of every name starts with two spaces, so together they hold the whole class
+        for trigram, sids in trigrams.items():
+            if trigram.startswith('  '):
+                candidates |= {sid for sid in sids if self._bySid[sid][1] == seat}
+        scored = []
+        for sid in candidates:
+            key = self._bySid[sid]
+            score = 0.8 * nameSimilarity(std_name, key[2]) + (0.2 if key[1] == seat else 0)
+            scored.append((round(score, 3), sid, *key))
+        scored.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        return scored[:limit]
+
+    def __len__(self):
+        return len(self._bySid)
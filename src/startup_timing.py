@@ -0,0 +1,42 @@
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+class StartupTimer:
+    """
+    Records named startup phases as milliseconds since an origin, normally taken as the first line of app.py runs.
+    The build type is part of the report, so plain-script and PyInstaller startups can be compared.
+    """
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases : dict[str, float] = {}
+
+    def mark(self, phase):
+        """
+        Record that a phase ended now, the first mark of a phase wins
+        """
+        if phase not in self.phases:
+            self.phases[phase] = round((time.perf_counter() - self.origin) * 1000, 1)
+        return self.phases[phase]
+
+    def report(self):
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'build': 'pyinstaller' if getattr(sys, 'frozen', False) else 'script',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'phases_ms': dict(self.phases),
+        }
+
+    def write(self, destination):
+        """
+        Append the report as one JSON line to the file at destination, or print it to stderr if destination is '-'
+        """
+        line = json.dumps(self.report(), ensure_ascii=False)
+        if destination == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(destination, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
@@ -0,0 +1,126 @@
+from itertools import islice
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from src.formatting import formatValue, formatRow
+
+class QueryTableModel(QAbstractTableModel):
+    """
+    A read-only table model over raw query result rows.
+    Rows are pulled from the source (a list or a live sqlite3 cursor) a page at a time as the view scrolls,
+    and a value is only turned into text when its cell is painted.
+    formatters optionally maps a column index to a callable that converts the raw value to its display text.
+    """
+    FETCH_SIZE = 256
+
+    def __init__(self, horizontal_header, rows, formatters=None, parent=None):
+        super().__init__(parent)
+        self._header = list(horizontal_header)
+        self._formatters = formatters or {}
+        self._rows = []
+        self._source = iter(rows)
+        self._exhausted = False
+        # Load the first page up front so the view has something to lay out
+        self._rows.extend(self._nextPage())
+
+    def _nextPage(self):
+        page = list(islice(self._source, self.FETCH_SIZE))
+        if len(page) < self.FETCH_SIZE:
+            self._exhausted = True
+            self._source = None
+        return page
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._header)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = self._nextPage()
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+    def fetchAll(self):
+        """
+        Pull every remaining row from the source
+        """
+        while not self._exhausted:
+            self.fetchMore()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return formatValue(self._rows[index.row()][index.column()], self._formatters.get(index.column()))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._header[section] if section < len(self._header) else None
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # A negative column means "unsorted", which keeps the query order and avoids pulling every row in
+        if column < 0 or column >= len(self._header):
+            return
+        self.fetchAll()
+        self.beginResetModel()
+        # Empty values go last, numbers are ordered before text so mixed columns never compare int with str
+        self._rows.sort(
+            key=lambda row: (row[column] is None, isinstance(row[column], str), row[column] if row[column] is not None else 0),
+            reverse=order == Qt.DescendingOrder
+        )
+        self.endResetModel()
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid() or row < 0 or row + count > len(self._rows):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self._rows[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def insertRowData(self, row, values):
+        """
+        Insert a row of raw values before the given row, at the end if row is past the loaded rows
+        """
+        row = max(0, min(row, len(self._rows)))
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.insert(row, tuple(values))
+        self.endInsertRows()
+
+    def findRow(self, column, value):
+        """
+        Get the index of the first row holding value in column, pulling the remaining rows in as needed, or -1 if there is none
+        """
+        self.fetchAll()
+        for row, values in enumerate(self._rows):
+            if values[column] == value:
+                return row
+        return -1
+
+    def headers(self):
+        return list(self._header)
+
+    def formatters(self):
+        return dict(self._formatters)
+
+    def rowData(self, row):
+        """
+        Get the raw values of a loaded row
+        """
+        return self._rows[row]
+
+    def iterDisplayRows(self):
+        """
+        Iterate over every row as display text, pulling the remaining rows from the source as needed
+        """
+        self.fetchAll()
+        for row in self._rows:
+            yield formatRow(row, self._formatters)
@@ -0,0 +1,139 @@
+"""
+Migrate a database laid out the way the first release created it, with the messy data real ones hold, and check the result.
+
+    python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from src.database import Database, MIGRATIONS
+from src.formatting import CATEGORY_NAMES
+
+# The tables as the first release created them: no indexes, no cascades, and the foreign key of records names a table "event"
+BASELINE_SCHEMA = '''
+    CREATE TABLE students (
+    sid INTEGER PRIMARY KEY AUTOINCREMENT,
+    class TEXT NOT NULL,
+    class_number INTEGER NOT NULL,
+    std_name TEXT NOT NULL,
+    category TEXT NOT NULL
+    );
+    CREATE TABLE events (
+    eid INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_name TEXT NOT NULL
+    );
+    CREATE TABLE records (
+    rid INTEGER PRIMARY KEY AUTOINCREMENT,
+    sid INTEGER NOT NULL,
+    eid INTEGER NOT NULL,
+    status TEXT DEFAULT '1',
+    FOREIGN KEY (sid) REFERENCES students(sid),
+    FOREIGN KEY (eid) REFERENCES event(eid)
+    );
+'''
+
+STUDENTS = [
+    ('1A', 1, '陳大文', 'C'),
+    ('1A', 2, 'Chan Tai Man', 'F'),
+    ('2B', 1, 'Wong Siu Ming', 'H'),
+    ('2B', 2, 'Chan Siu Ling', 'f'), # Not a known category code
+    ('12C', 3, 'Lee Ka Yan', 'S'),
+    ('6S', 4, 'Ho Wing', 'D'),
+    ('G1', 5, 'Cheung Mei', 'C'), # No form in the class name
+]
+# "Run" was added twice, as the first release allowed
+EVENTS = ['Run', 'Swim', 'Run', 'Chess']
+RECORDS = [
+    (1, 1), (2, 1), (3, 1), (6, 1),
+    (1, 3), (4, 3), # Student 1 is in both copies of "Run"
+    (1, 2), (7, 2),
+    (5, 4), (6, 4),
+    (99, 1), # A student removed without their records
+    (2, 42), # An event removed without its records
+]
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'database.db')
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.executescript(BASELINE_SCHEMA)
+            conn.executemany('INSERT INTO students (class, class_number, std_name, category) VALUES (?, ?, ?, ?)', STUDENTS)
+            conn.executemany('INSERT INTO events (event_name) VALUES (?)', [(name,) for name in EVENTS])
+            conn.executemany('INSERT INTO records (sid, eid) VALUES (?, ?)', RECORDS)
+        conn.close()
+        self.db = Database(self.path)
+        self.db.migrate()
+
+    def tearDown(self):
+        self.db.conn.close()
+        self.directory.cleanup()
+
+    def recount(self):
+        """
+        Get the participants per (eid, category_id) counted from records, next to the ones kept in event_category_counts
+        """
+        counted = self.db.conn.execute('''
+            SELECT records.eid, students.category_id, COUNT(*) FROM records JOIN students ON records.sid = students.sid
+            GROUP BY records.eid, students.category_id
+        ''').fetchall()
+        kept = self.db.conn.execute('''
+            SELECT eid, category_id, participants FROM event_category_counts WHERE participants != 0
+        ''').fetchall()
+        return sorted(counted), sorted(kept)
+
+    def testSchemaIsCurrentAndConsistent(self):
+        self.assertEqual(self.db.getSchemaVersion(), len(MIGRATIONS))
+        self.assertEqual(self.db.conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+        self.assertEqual(self.db.conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual(self.db.conn.execute('PRAGMA foreign_keys').fetchone()[0], 1)
+
+    def testKeepsEveryStudent(self):
+        self.assertEqual(
+            sorted(self.db.getAllStudents()),
+            sorted((class_name, number, name, CATEGORY_NAMES.get(code, code)) for class_name, number, name, code in STUDENTS)
+        )
+        forms = dict(self.db.conn.execute('SELECT class_name, form FROM classes').fetchall())
+        self.assertEqual(forms, {'1A': 1, '2B': 2, '12C': 12, '6S': 6, 'G1': None})
+
+    def testMergesDuplicateEventsAndDropsOrphans(self):
+        self.assertEqual(sorted(self.db.getAllEvents()), [('Chess',), ('Run',), ('Swim',)])
+        # Student 1 is kept once in "Run", the records of the removed student and event are gone
+        self.assertEqual(self.db.getTotalNumberOfRecords(), 9)
+        self.assertEqual(self.db.conn.execute('''
+            SELECT COUNT(*) FROM (SELECT sid, eid FROM records GROUP BY sid, eid HAVING COUNT(*) > 1)
+        ''').fetchone()[0], 0)
+        self.assertEqual(sorted(self.db.getStudentEventTable()), [('Chess', 2), ('Run', 5), ('Swim', 2)])
+
+    def testCountsMatchRecords(self):
+        counted, kept = self.recount()
+        self.assertEqual(counted, kept)
+
+    def testCountsFollowLaterChanges(self):
+        self.db.removeStudent(1)
+        chess = self.db.findEid('Chess')
+        self.assertEqual(self.db.enrollStudents(chess, [('1A', 2, 'Chan Tai Man'), ('2B', 2, 'Chan Siu Ling')]), [])
+        counted, kept = self.recount()
+        self.assertEqual(counted, kept)
+        self.assertEqual(self.db.conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual(self.db.conn.execute('SELECT COUNT(*) FROM records WHERE sid = 1').fetchone()[0], 0)
+
+    def testSearch(self):
+        self.assertEqual(
+            sorted(self.db.searchStudents('chan')),
+            [('1A', 2, 'Chan Tai Man', '全免'), ('2B', 2, 'Chan Siu Ling', 'f')]
+        )
+        self.assertEqual(self.db.searchStudents('Chan 1A'), [('1A', 2, 'Chan Tai Man', '全免')])
+        self.assertEqual(self.db.searchStudents('陳大文'), [('1A', 1, '陳大文', '綜援')])
+        self.assertEqual(len(self.db.searchStudents('2B')), 2)
+        self.assertEqual(self.db.searchStudents('Nobody'), [])
+
+    def testMigrateAgainChangesNothing(self):
+        before = self.recount(), sorted(self.db.getAllStudents()), self.db.getTotalNumberOfRecords()
+        self.db.migrate()
+        self.assertEqual((self.recount(), sorted(self.db.getAllStudents()), self.db.getTotalNumberOfRecords()), before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,12 @@ class Ui_MainWindow(object):
         if not MainWindow.objectName():
             MainWindow.setObjectName(u"MainWindow")
         MainWindow.resize(1280, 720)
+        self.actionBackupNow = QAction(MainWindow)
+        self.actionBackupNow.setObjectName(u"actionBackupNow")
+        self.actionRestoreBackup = QAction(MainWindow)
+        self.actionRestoreBackup.setObjectName(u"actionRestoreBackup")
+        self.actionArchiveYear = QAction(MainWindow)
+        self.actionArchiveYear.setObjectName(u"actionArchiveYear")
         self.actionAbout = QAction(MainWindow)
         self.actionAbout.setObjectName(u"actionAbout")
         self.centralwidget = QWidget(MainWindow)
@@ -112,9 +118,29 @@ class Ui_MainWindow(object):
 
         self.gridLayout_2.addWidget(self.studentParticipatesButton, 6, 1, 1, 1)
 
+        self.label_10 = QLabel(self.frame)
+        self.label_10.setObjectName(u"label_10")
+
+        self.gridLayout_2.addWidget(self.label_10, 10, 0, 1, 1)
+
+        self.categoryCrosstabButton = QPushButton(self.frame)
+        self.categoryCrosstabButton.setObjectName(u"categoryCrosstabButton")
+
+        self.gridLayout_2.addWidget(self.categoryCrosstabButton, 10, 1, 1, 1)
+
+        self.label_11 = QLabel(self.frame)
+        self.label_11.setObjectName(u"label_11")
+
+        self.gridLayout_2.addWidget(self.label_11, 11, 0, 1, 1)
+
+        self.studentYearlyCountsButton = QPushButton(self.frame)
+        self.studentYearlyCountsButton.setObjectName(u"studentYearlyCountsButton")
+
+        self.gridLayout_2.addWidget(self.studentYearlyCountsButton, 11, 1, 1, 1)
+
         self.verticalSpacer = QSpacerItem(20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
 
-        self.gridLayout_2.addItem(self.verticalSpacer, 10, 0, 1, 1)
+        self.gridLayout_2.addItem(self.verticalSpacer, 12, 0, 1, 1)
 
         self.manualEventInfoButton = QPushButton(self.frame)
         self.manualEventInfoButton.setObjectName(u"manualEventInfoButton")
@@ -175,6 +201,8 @@ class Ui_MainWindow(object):
         self.menubar = QMenuBar(MainWindow)
         self.menubar.setObjectName(u"menubar")
         self.menubar.setGeometry(QRect(0, 0, 1280, 33))
+        self.menuData = QMenu(self.menubar)
+        self.menuData.setObjectName(u"menuData")
         self.menuAbout = QMenu(self.menubar)
         self.menuAbout.setObjectName(u"menuAbout")
         MainWindow.setMenuBar(self.menubar)
@@ -182,7 +210,12 @@ class Ui_MainWindow(object):
         self.statusbar.setObjectName(u"statusbar")
         MainWindow.setStatusBar(self.statusbar)
 
+        self.menubar.addAction(self.menuData.menuAction())
         self.menubar.addAction(self.menuAbout.menuAction())
+        self.menuData.addAction(self.actionBackupNow)
+        self.menuData.addAction(self.actionRestoreBackup)
+        self.menuData.addSeparator()
+        self.menuData.addAction(self.actionArchiveYear)
         self.menuAbout.addAction(self.actionAbout)
 
         self.retranslateUi(MainWindow)
@@ -192,6 +225,9 @@ class Ui_MainWindow(object):
 
     def retranslateUi(self, MainWindow):
         MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"MainWindow", None))
+        self.actionBackupNow.setText(QCoreApplication.translate("MainWindow", u"Back Up Now", None))
+        self.actionRestoreBackup.setText(QCoreApplication.translate("MainWindow", u"Restore Backup...", None))
+        self.actionArchiveYear.setText(QCoreApplication.translate("MainWindow", u"Archive School Year...", None))
         self.actionAbout.setText(QCoreApplication.translate("MainWindow", u"About", None))
         self.manualStudentInfoButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.studentParticipatesByEventButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
@@ -201,6 +237,10 @@ class Ui_MainWindow(object):
         self.label_4.setText(QCoreApplication.translate("MainWindow", u"\u5b78\u751f\u8cc7\u6599", None))
         self.studentEventTableWithCategoryAndNameButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.studentParticipatesButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
+        self.label_10.setText(QCoreApplication.translate("MainWindow", u"\u6d3b\u52d5\u51fa\u5e2d\u4eba\u6578(\u5404\u7d93\u6fdf\u60c5\u6cc1)", None))
+        self.categoryCrosstabButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
+        self.label_11.setText(QCoreApplication.translate("MainWindow", u"\u5b78\u751f\u6b77\u5e74\u6d3b\u52d5\u6b21\u6578", None))
+        self.studentYearlyCountsButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.manualEventInfoButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.studentEventTableWithCategoryButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.label_8.setText(QCoreApplication.translate("MainWindow", u"\u6d3b\u52d5\u51fa\u5e2d\u5b78\u751f\u59d3\u540d", None))
@@ -209,6 +249,7 @@ class Ui_MainWindow(object):
         self.label_7.setText(QCoreApplication.translate("MainWindow", u"\u6d3b\u52d5\u51fa\u5e2d\u4eba\u6578", None))
         self.manualEditInfoButton.setText(QCoreApplication.translate("MainWindow", u"Click", None))
         self.label_9.setText(QCoreApplication.translate("MainWindow", u"\u66f4\u6539\u8cc7\u6599", None))
+        self.menuData.setTitle(QCoreApplication.translate("MainWindow", u"Data", None))
         self.menuAbout.setTitle(QCoreApplication.translate("MainWindow", u"Help", None))
     # retranslateUi
 
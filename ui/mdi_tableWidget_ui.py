@@ -17,7 +17,7 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QPalette, QPixmap, QRadialGradient, QTransform)
 from PySide6.QtWidgets import (QApplication, QFrame, QGridLayout, QHeaderView,
     QLabel, QPushButton, QSizePolicy, QSpacerItem,
-    QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+    QTableView, QVBoxLayout, QWidget)
 
 class Ui_MDITableWidget(object):
     def setupUi(self, MDITableWidget):
@@ -26,7 +26,7 @@ class Ui_MDITableWidget(object):
         MDITableWidget.resize(320, 240)
         self.verticalLayout = QVBoxLayout(MDITableWidget)
         self.verticalLayout.setObjectName(u"verticalLayout")
-        self.tableWidget = QTableWidget(MDITableWidget)
+        self.tableWidget = QTableView(MDITableWidget)
         self.tableWidget.setObjectName(u"tableWidget")
         sizePolicy = QSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         sizePolicy.setHorizontalStretch(0)
@@ -17,8 +17,8 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QPalette, QPixmap, QRadialGradient, QTransform)
 from PySide6.QtWidgets import (QAbstractButton, QAbstractItemView, QApplication, QDialog,
     QDialogButtonBox, QGroupBox, QHBoxLayout, QHeaderView,
-    QSizePolicy, QTabWidget, QTableWidget, QTableWidgetItem,
-    QVBoxLayout, QWidget)
+    QSizePolicy, QTabWidget, QTableView, QVBoxLayout,
+    QWidget)
 
 class Ui_TableEditDialog(object):
     def setupUi(self, TableEditDialog):
@@ -33,7 +33,7 @@ class Ui_TableEditDialog(object):
         self.tab.setObjectName(u"tab")
         self.horizontalLayout = QHBoxLayout(self.tab)
         self.horizontalLayout.setObjectName(u"horizontalLayout")
-        self.studentInfoTable = QTableWidget(self.tab)
+        self.studentInfoTable = QTableView(self.tab)
         self.studentInfoTable.setObjectName(u"studentInfoTable")
         self.studentInfoTable.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked)
         self.studentInfoTable.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
@@ -51,7 +51,7 @@ class Ui_TableEditDialog(object):
         self.tab_2.setObjectName(u"tab_2")
         self.horizontalLayout_2 = QHBoxLayout(self.tab_2)
         self.horizontalLayout_2.setObjectName(u"horizontalLayout_2")
-        self.eventInfoTable = QTableWidget(self.tab_2)
+        self.eventInfoTable = QTableView(self.tab_2)
         self.eventInfoTable.setObjectName(u"eventInfoTable")
         self.eventInfoTable.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked)
         self.eventInfoTable.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)